@@ -0,0 +1,91 @@
+"""
+Script for compacting a database by hydrogenic scaling.
+
+The tables of every Z are compared with those scaled from a reference Z, and
+the stored rows of every Z whose scaling is accurate enough are removed. Grids
+of those Z are then scaled from the reference Z when read.
+"""
+import sys
+from pathlib import Path
+from argparse import ArgumentParser, Namespace
+
+this_path: Path = Path(__file__)
+if (pkg_path := this_path.parents[1]) not in sys.path:
+    sys.path.append(str(pkg_path))
+
+from src.utils.scaling import compact_database, SCALING_TABLE, TOLERANCE
+
+def main(args: Namespace) -> None:
+    print("Compacting database:")
+    print(f"> Parsed: {args}")
+
+    reports = compact_database(
+        name = args.name,
+        tables = args.data_types,
+        z_ref = args.z_ref,
+        tolerance = args.tolerance,
+        dry_run = args.dry_run,
+    )
+
+    print(f"> Validated {len(reports)} scalings from Z={args.z_ref}:")
+    print(
+        f"  {'table':>5} {'case':>4} {'Z':>2} {'exponent':>8} "
+        f"{'max [dex]':>9} {'rms [dex]':>9} {'coverage':>8}  accepted"
+    )
+    for r in reports:
+        print(
+            f"  {r.data_type:>5} {r.rec_case:>4} {r.z:>2} {r.exponent:>8.3f} "
+            f"{r.max_error:>9.2e} {r.rms_error:>9.2e} {r.coverage:>8.1%}  "
+            f"{'yes' if r.accepted else 'no'}"
+        )
+
+    n_accepted: int = sum(r.accepted for r in reports)
+    if args.dry_run:
+        print(f"> Dry run: {n_accepted} scalings would be accepted.")
+    else:
+        print(
+            f"> Removed the stored rows of {n_accepted} scalings, and recorded "
+            f"all reports in the '{SCALING_TABLE}' table."
+        )
+
+    print("> Success! Finished compacting database.")
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        'compact_db',
+        description = 'replaces the tables of each Z by hydrogenic scaling where accurate',
+    )
+    parser.add_argument(
+        '--name',
+        required = False,
+        default = 'db',
+        type = str,
+        help = 'name of the database',
+    )
+    parser.add_argument(
+        '--data_types',
+        nargs = '*',
+        required = False,
+        default = None,
+        help = 'data types to compact (default: all)',
+    )
+    parser.add_argument(
+        '--z_ref',
+        required = False,
+        default = 1,
+        type = int,
+        help = 'Z kept as the reference',
+    )
+    parser.add_argument(
+        '--tolerance',
+        required = False,
+        default = TOLERANCE,
+        type = float,
+        help = 'largest accepted scaling error in dex',
+    )
+    parser.add_argument(
+        '--dry_run',
+        action = 'store_true',
+        help = 'only report the accuracy of each scaling',
+    )
+    main(parser.parse_args())
@@ -9,7 +9,7 @@ this_path: Path = Path(__file__)
 if (pkg_path := this_path.parents[1]) not in sys.path:
     sys.path.append(str(pkg_path))
 
-from src.utils.writing import create_dataframes, connect_to_db, write_dfs_to_db
+from src.utils.writing import iter_sorted_chunks, connect_to_db, write_chunks_to_db
 
 DEFAULT_NAMESPACE: Namespace = Namespace()
 DEFAULT_NAMESPACE.name = 'db'
@@ -17,6 +17,9 @@ DEFAULT_NAMESPACE.rec_case = None
 DEFAULT_NAMESPACE.data_types = None
 DEFAULT_NAMESPACE.z_bounds = (1, 1)
 DEFAULT_NAMESPACE.replace = True
+DEFAULT_NAMESPACE.no_cache = False
+DEFAULT_NAMESPACE.cache_size = 2048
+DEFAULT_NAMESPACE.aggregates = False
 
 def main(args: Namespace) -> None:
     print("Initialising database:")
@@ -36,16 +39,6 @@ def main(args: Namespace) -> None:
     
     print("> Found data files in 'VI_64'.")
     
-    # Creating the dataframes
-    dataframes = create_dataframes(
-        data_dir,
-        rec_case = args.rec_case,
-        data_types = args.data_types,
-        z_bounds = args.z_bounds,
-    )
-    
-    print("> Created dataframes.")
-
     # Create connection to db
     _, connection = connect_to_db(
         name = args.name,
@@ -54,9 +47,19 @@ def main(args: Namespace) -> None:
 
     print("> Connected to the database.")
 
-    # Write dataframes to db
-    write_dfs_to_db(
-        dataframes,
+    # Read data files in key order and stream them to the db
+    chunks_itr = iter_sorted_chunks(
+        data_dir,
+        rec_case = args.rec_case,
+        data_types = args.data_types,
+        z_bounds = args.z_bounds,
+        use_cache = not args.no_cache,
+        cache_size = args.cache_size * 2**20,
+        aggregates = args.aggregates,
+    )
+
+    write_chunks_to_db(
+        chunks_itr,
         connection,
         if_exists = 'append', # Appends to the initialised database
     )
@@ -103,4 +106,21 @@ if __name__ == '__main__':
         default = True,
         help = 'whether to replace the previous database with the same name'
     )
+    parser.add_argument(
+        '--no_cache',
+        action = 'store_true',
+        help = 'parse every data file instead of using the parse cache',
+    )
+    parser.add_argument(
+        '--cache_size',
+        required = False,
+        default = 2048,
+        type = int,
+        help = 'maximum size of the parse cache in MB',
+    )
+    parser.add_argument(
+        '--aggregates',
+        action = 'store_true',
+        help = 'also write series sums, totals, and ratios to H-beta',
+    )
     main(parser.parse_args())
\ No newline at end of file
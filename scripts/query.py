@@ -0,0 +1,126 @@
+"""
+Script for querying a database from the command line.
+
+The query is built from the same clauses as 'Query', and its result is streamed
+in chunks (at constant memory) to a file or to stdout, as CSV, as a '.npy'
+array of records, or as raw binary records. For example:
+
+    python scripts/query.py --table emi --select n_u n_l temp dens val \\
+        --where z "z == 1" --where n_l "n_l == 2" --format npy --output hb.npy
+
+Binary records are packed without padding, with native byte order (see
+'src/utils/extracting.py'). Their dtype is printed to stderr, e.g. for reading
+with 'numpy.fromfile'.
+"""
+import sys
+from pathlib import Path
+from argparse import ArgumentParser, Namespace
+
+this_path: Path = Path(__file__)
+if (pkg_path := this_path.parents[1]) not in sys.path:
+    sys.path.append(str(pkg_path))
+
+from src.utils.reading import Query
+from src.utils.extracting import extract, DEFAULT_CHUNK_SIZE
+
+def main(args: Namespace) -> None:
+    names = args.name[0] if len(args.name) == 1 else args.name
+
+    with Query.START(names) as q:
+        q = q.FROM(args.table).SELECT(*args.select)
+
+        for column, logic in args.where:
+            q = q.WHERE(column.split(',') if ',' in column else column, logic)
+        if args.order_by:
+            q = q.ORDER_BY(args.order_by, descending=args.descending)
+        if args.limit:
+            q = q.LIMIT(args.limit)
+
+        n_rows, dtype = extract(
+            q, args.output, fmt=args.format, chunk_size=args.chunk_size,
+        )
+
+    if dtype is not None:
+        print(f"> Record dtype: {dtype.descr}", file=sys.stderr)
+    print(f"> Wrote {n_rows} rows.", file=sys.stderr)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        'query',
+        description = 'streams the result of a query to a file or stdout',
+    )
+    parser.add_argument(
+        '--name',
+        action = 'append',
+        default = None,
+        type = str,
+        help = 'name of the database (repeat to query several as one)',
+    )
+    parser.add_argument(
+        '--table',
+        required = True,
+        type = str,
+        help = 'table to query',
+    )
+    parser.add_argument(
+        '--select',
+        nargs = '+',
+        default = ['*'],
+        help = 'columns to retrieve (default: all)',
+    )
+    parser.add_argument(
+        '--where',
+        nargs = 2,
+        action = 'append',
+        default = [],
+        metavar = ('COLUMN', 'LOGIC'),
+        help = 'filter, e.g. --where z "z == 1" (comma-separate several columns)',
+    )
+    parser.add_argument(
+        '--order_by',
+        nargs = '+',
+        default = None,
+        help = 'columns to sort by',
+    )
+    parser.add_argument(
+        '--descending',
+        action = 'store_true',
+        help = 'sort in descending order',
+    )
+    parser.add_argument(
+        '--limit',
+        required = False,
+        default = None,
+        type = int,
+        help = 'maximum number of rows',
+    )
+    parser.add_argument(
+        '--format',
+        default = 'csv',
+        choices = ('csv', 'npy', 'bin'),
+        help = 'output format',
+    )
+    parser.add_argument(
+        '--output',
+        required = False,
+        default = None,
+        type = Path,
+        help = 'output file (default: stdout)',
+    )
+    parser.add_argument(
+        '--chunk_size',
+        required = False,
+        default = DEFAULT_CHUNK_SIZE,
+        type = int,
+        help = 'number of rows fetched at a time',
+    )
+    args = parser.parse_args()
+    if args.name is None: args.name = ['db']
+
+    try:
+        main(args)
+    except BrokenPipeError:
+        # The reader (e.g. 'head') closed the pipe early
+        import os
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
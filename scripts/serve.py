@@ -0,0 +1,54 @@
+"""
+Script for serving a database from memory over a Unix domain socket.
+
+Clients connect using 'RemoteQuery' or 'RemoteClient' from 
+'src.utils.serving'.
+"""
+import sys
+from pathlib import Path
+from argparse import ArgumentParser, Namespace
+
+this_path: Path = Path(__file__)
+if (pkg_path := this_path.parents[1]) not in sys.path:
+    sys.path.append(str(pkg_path))
+
+from src.utils.serving import GridServer
+
+def main(args: Namespace) -> None:
+    print("Starting server:")
+    print(f"> Parsed: {args}")
+
+    server = GridServer(name=args.name, socket_path=args.socket)
+
+    print(f"> Loaded database '{args.name}' into memory.")
+    print(f"> Listening on {server.socket_path}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    print("> Server stopped.")
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        'serve',
+        description = 'serves a database from memory over a unix socket',
+    )
+    parser.add_argument(
+        '--name',
+        required = False,
+        default = 'db',
+        type = str,
+        help = 'name of the database to serve',
+    )
+    parser.add_argument(
+        '--socket',
+        required = False,
+        default = None,
+        type = Path,
+        help = 'location of the socket (default: databases/<name>.sock)',
+    )
+    main(parser.parse_args())
@@ -4,4 +4,12 @@ and retrieving data from these databases easily.
 """
 from .parsing import *
 from .writing import *
-from .reading import *
\ No newline at end of file
+from .reading import *
+from .grid import *
+from .diagnostics import *
+from .synthesis import *
+from .extrapolation import *
+from .populations import *
+from .opacity import *
+from .scaling import *
+from .extracting import *
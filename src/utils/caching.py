@@ -0,0 +1,188 @@
+"""
+Submodule containing utilities for caching parsed data files.
+
+Each data file is parsed once, and its blocks (every data type) are saved as
+compact arrays in the cache directory. The cache entry is keyed by the file's
+hash and the parser version, so changed files and parser updates are never
+served stale data.
+"""
+from typing import Optional, Iterable
+from pathlib import Path
+
+from ..custom_types import DataType
+from .parsing.physical_state import PhysicalState
+
+this_file: Path = Path(__file__)
+cache_dir: Path = this_file.parents[2] / 'cache'
+
+# Bump whenever parsing changes the stored arrays
+PARSER_VERSION: int = 1
+# Default limit on the cache's size in bytes
+CACHE_SIZE: int = 2 << 30
+
+def file_hash(
+    path: Path,
+    chunk_size: int = 1 << 20,
+) -> str:
+    """
+    Returns the SHA-256 hash of a file's contents.
+    """
+    from hashlib import sha256
+
+    h = sha256()
+    with open(path, 'rb') as f:
+        while (chunk := f.read(chunk_size)):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+def get_cache_path(
+    path: Path,
+    directory: Optional[Path] = None,
+) -> Path:
+    """
+    Returns the location of a data file's cache entry.
+    """
+    if directory is None: directory = cache_dir
+
+    return directory / f"{file_hash(path)}_v{PARSER_VERSION}.npz"
+
+def save_physical_states(
+    physical_states: dict[DataType, PhysicalState],
+    path: Path,
+) -> None:
+    """
+    Saves compacted physical states, all stemming from the same data file, to
+    a single '.npz' file. The file is written atomically.
+    """
+    from os import replace
+    from numpy import savez, array
+
+    arrays: dict = {}
+    for dtype, physical_state in physical_states.items():
+        assert physical_state.data_blocks is None
+        if physical_state.store is None: continue
+
+        for name, arr in physical_state.store.toArrays().items():
+            arrays[f"{dtype}.{name}"] = arr
+
+    some_state: PhysicalState = next(iter(physical_states.values()))
+    arrays['header'] = array([
+        some_state.rec_case,
+        str(some_state.z),
+        str(some_state.n_c),
+    ])
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path: Path = path.with_name(path.name + '.tmp')
+    try:
+        with open(tmp_path, 'wb') as f:
+            savez(f, **arrays)
+        replace(tmp_path, path)
+    finally:
+        # Only left behind if writing failed
+        tmp_path.unlink(missing_ok=True)
+
+def load_physical_states(
+    path: Path,
+    data_types: Optional[Iterable[DataType]] = None,
+) -> dict[DataType, PhysicalState]:
+    """
+    Loads (compacted) physical states saved by 'save_physical_states'.
+    """
+    from numpy import load
+
+    from .parsing.block_store import BlockStore, ARRAY_NAMES
+    from .parsing.block_index import DTYPE_LETTERS
+
+    if data_types is None: data_types = DTYPE_LETTERS.keys()
+
+    physical_states: dict[DataType, PhysicalState] = {}
+    with load(path) as npz:
+        rec_case, z, n_c = npz['header'].tolist()
+        z, n_c = int(z), int(n_c)
+
+        for dtype in data_types:
+            physical_state = PhysicalState(
+                rec_case, z,
+                n_c = n_c,
+                data_type = dtype,
+            )
+
+            if f"{dtype}.{ARRAY_NAMES[0]}" in npz.files:
+                physical_state.store = BlockStore.from_arrays(
+                    rec_case, z, dtype,
+                    dict(
+                        (name, npz[f"{dtype}.{name}"]) \
+                        for name in ARRAY_NAMES
+                    ),
+                )
+
+            physical_states[dtype] = physical_state
+
+    return physical_states
+
+def evict(
+    directory: Optional[Path] = None,
+    max_size: int = CACHE_SIZE,
+) -> list[Path]:
+    """
+    Removes the least recently used cache entries until the cache's total size
+    is at most 'max_size' bytes. Returns the removed entries.
+    """
+    from os import remove
+
+    if directory is None: directory = cache_dir
+    if not directory.exists(): return []
+
+    # Entries are touched whenever used, so the oldest ones go first
+    entries: list[tuple[float, int, Path]] = sorted(
+        (stat.st_mtime, stat.st_size, entry) \
+        for entry in directory.glob('*.npz') \
+        if (stat := entry.stat())
+    )
+
+    total_size: int = sum(size for _, size, _ in entries)
+
+    removed: list[Path] = []
+    for _, size, entry in entries:
+        if total_size <= max_size: break
+
+        remove(entry)
+        total_size -= size
+        removed.append(entry)
+
+    return removed
+
+def load_or_parse(
+    path: Path,
+    data_types: Optional[Iterable[DataType]] = None,
+    directory: Optional[Path] = None,
+    max_size: int = CACHE_SIZE,
+) -> dict[DataType, PhysicalState]:
+    """
+    Returns the data file's (compacted) physical states, parsing the file only
+    if it isn't already cached. Parsed files are cached for all data types,
+    regardless of which are requested.
+    """
+    from os import utime
+
+    from .writing import stream_datafile
+
+    path_to_cache: Path = get_cache_path(path, directory=directory)
+
+    if path_to_cache.exists():
+        # Mark entry as recently used
+        utime(path_to_cache)
+        return load_physical_states(path_to_cache, data_types=data_types)
+
+    physical_states = PhysicalState.from_chunks(
+        stream_datafile(path),
+        compact = True,
+    )
+    save_physical_states(physical_states, path_to_cache)
+    _ = evict(directory=path_to_cache.parent, max_size=max_size)
+
+    if data_types is None: return physical_states
+
+    return dict((dtype, physical_states[dtype]) for dtype in data_types)
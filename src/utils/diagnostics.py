@@ -0,0 +1,202 @@
+"""
+Submodule containing utilities for inferring (temp, dens) from observed line
+ratios.
+
+Model ratios are evaluated over the whole (refined) grid at once, and the chi2
+of every spectrum at every grid point is computed with matrix products, so
+large batches of spectra are handled without Python-level loops.
+"""
+from typing import Optional, Sequence, Union
+from dataclasses import dataclass
+import numpy as np
+
+from ..custom_types import RecType
+from .grid import Grid, Transition
+
+Ratio = tuple[Transition, Transition]
+
+@dataclass(slots=True)
+class DiagnosticResult:
+    """
+    Best-fit (temp, dens) per spectrum, the corresponding chi2, and (if
+    requested) the normalised likelihood surfaces over the refined grid. All
+    are NaN for spectra without usable ratios.
+    """
+    temp: np.ndarray[float]
+    dens: np.ndarray[float]
+    chi2: np.ndarray[float]
+
+    temps: np.ndarray[float]
+    denss: np.ndarray[float]
+    likelihood: Optional[np.ndarray[float]] = None
+
+def ratio_transitions(ratios: Sequence[Ratio]) -> list[Transition]:
+    """
+    Returns the unique transitions appearing in the ratios.
+    """
+    return sorted(set(
+        tuple(trans) for ratio in ratios for trans in ratio
+    ))
+
+def load_ratio_grid(
+    ratios: Sequence[Ratio],
+    z: int = 1,
+    rec_case: RecType = 'B',
+    table: str = 'emi',
+    name: Optional[str] = None,
+) -> Grid:
+    """
+    Reads the grid of every transition needed to evaluate the ratios.
+    """
+    return Grid.from_query(
+        table, z, rec_case,
+        transitions = ratio_transitions(ratios),
+        name = name,
+    )
+
+def model_ratios(
+    grid: Grid,
+    ratios: Sequence[Ratio],
+) -> np.ndarray[float]:
+    """
+    Evaluates the ratios at every grid point, returning an array with shape
+    (n_temp, n_dens, n_ratios).
+    """
+    num = grid.indicesOf([ratio[0] for ratio in ratios])
+    den = grid.indicesOf([ratio[1] for ratio in ratios])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return grid.values[..., num] / grid.values[..., den]
+
+def interpolate_ratios(
+    grid: Grid,
+    ratios: Sequence[Ratio],
+    temp: np.ndarray[float],
+    dens: np.ndarray[float],
+    gradient: bool = False,
+) -> Union[np.ndarray[float], tuple[np.ndarray[float], ...]]:
+    """
+    Interpolates the ratios at the (temp, dens) points, returning an array with
+    shape (n_points, n_ratios).
+
+    If 'gradient' is True, the derivatives with respect to log10 temp and log10
+    dens are returned as well, as a tuple (ratios, d_dlog_temp, d_dlog_dens),
+    from those of the interpolated numerators and denominators (see
+    'Grid.interpolate').
+    """
+    num = grid.indicesOf([ratio[0] for ratio in ratios])
+    den = grid.indicesOf([ratio[1] for ratio in ratios])
+
+    if not gradient:
+        values = grid.interpolate(temp, dens)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return values[:, num] / values[:, den]
+
+    values, d_dx, d_dy = grid.interpolate(temp, dens, gradient=True)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = values[:, num] / values[:, den]
+
+        # dR / R = dN / N - dD / D
+        return (
+            out,
+            out * (d_dx[:, num] / values[:, num] - d_dx[:, den] / values[:, den]),
+            out * (d_dy[:, num] / values[:, num] - d_dy[:, den] / values[:, den]),
+        )
+
+def solve_line_ratios(
+    grid: Grid,
+    ratios: Sequence[Ratio],
+    observed: np.ndarray[float],
+    sigma: np.ndarray[float],
+    refine: int = 4,
+    return_likelihood: bool = False,
+    batch_size: int = 4096,
+) -> DiagnosticResult:
+    """
+    Finds the best-fit (temp, dens) of many spectra at once.
+
+    Parameters
+    ----------
+    grid:
+        Grid containing every transition of the ratios (see 'load_ratio_grid').
+    ratios:
+        The (numerator, denominator) transitions of each ratio.
+    observed, sigma:
+        Observed ratios and their uncertainties, with shape (n_spectra,
+        n_ratios). NaN entries are ignored.
+    refine:
+        The grid is refined by this factor, by interpolation, before fitting.
+    return_likelihood:
+        Whether to return the likelihood surfaces, with shape (n_spectra,
+        n_temp, n_dens) on the refined grid.
+    batch_size:
+        Number of spectra processed at a time, limiting memory use.
+
+    Spectra without usable ratios, i.e. without valid observations or with
+    none that the grid can model at any point, get NaN results.
+    """
+    from numpy import atleast_2d, isfinite, where, argmin, exp, inf, nan, empty
+
+    observed = atleast_2d(np.asarray(observed, dtype=float))
+    sigma = atleast_2d(np.asarray(sigma, dtype=float))
+    assert observed.shape == sigma.shape
+    assert observed.shape[1] == len(ratios)
+
+    if refine > 1:
+        grid = grid.refine(refine)
+
+    # Model ratios as a (n_ratios, n_points) matrix
+    n_temp, n_dens = grid.temps.size, grid.denss.size
+    models = model_ratios(grid, ratios).reshape(n_temp * n_dens, -1).T
+
+    # Ratios that cannot be modelled at a point only exclude that point for
+    # the spectra observing them
+    invalid = (~isfinite(models)).astype(float)
+    models = where(invalid > 0, 0., models)
+
+    # Missing observations get zero weight
+    valid_obs = isfinite(observed) & isfinite(sigma) & (sigma > 0)
+    weights = where(valid_obs, 1 / where(valid_obs, sigma, 1.)**2, 0.)
+    observed = where(valid_obs, observed, 0.)
+    unusable = ~valid_obs.any(axis=1)
+
+    n_spectra: int = observed.shape[0]
+    best = empty(n_spectra, dtype=int)
+    chi2_min = empty(n_spectra, dtype=float)
+    likelihood = empty((n_spectra, n_temp * n_dens)) \
+        if return_likelihood else None
+
+    for start in range(0, n_spectra, batch_size):
+        sel = slice(start, start + batch_size)
+        w, o = weights[sel], observed[sel]
+
+        # chi2 = sum w (o - m)^2 = sum w o^2 - 2 sum w o m + sum w m^2
+        chi2 = (w * o**2).sum(axis=1, keepdims=True) \
+            - 2 * (w * o) @ models \
+            + w @ models**2
+        np.maximum(chi2, 0., out=chi2) # Round-off
+        chi2[((w > 0) @ invalid) > 0] = inf
+
+        best[sel] = argmin(chi2, axis=1)
+        chi2_min[sel] = chi2[np.arange(chi2.shape[0]), best[sel]]
+        unusable[sel] |= ~isfinite(chi2_min[sel])
+
+        if return_likelihood:
+            with np.errstate(invalid='ignore'):
+                surface = exp(-0.5 * (chi2 - chi2_min[sel, None]))
+                likelihood[sel] = surface / surface.sum(axis=1, keepdims=True)
+            likelihood[sel][unusable[sel]] = nan
+
+    i_temp, i_dens = np.unravel_index(best, (n_temp, n_dens))
+    chi2_min[unusable] = nan
+
+    return DiagnosticResult(
+        temp = where(unusable, nan, grid.temps[i_temp]),
+        dens = where(unusable, nan, grid.denss[i_dens]),
+        chi2 = chi2_min,
+        temps = grid.temps,
+        denss = grid.denss,
+        likelihood = None if likelihood is None \
+            else likelihood.reshape(n_spectra, n_temp, n_dens),
+    )
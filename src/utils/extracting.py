@@ -0,0 +1,155 @@
+"""
+Submodule containing utilities for extracting the result of a query to a file
+(or stdout) at constant memory, as used by 'scripts/query.py'.
+
+The result is streamed in chunks, as CSV, as a '.npy' array of records, or as
+raw binary records. Binary records are packed without padding, with native byte
+order.
+"""
+import sys
+from typing import Literal, Optional
+from pathlib import Path
+import numpy as np
+
+from .reading import Query
+
+Format = Literal['csv', 'npy', 'bin']
+
+DEFAULT_CHUNK_SIZE: int = 65536
+
+def get_layout(q: Query) -> tuple[np.dtype, int]:
+    """
+    Returns the record dtype of the query's columns and the number of rows of
+    its result, in a single pass over the result.
+
+    The dtype follows from the storage classes of the values in the result
+    (declared column types are not reliable, and absent from databases built by
+    'initialise_db'). Columns holding only integers are 'i8', columns holding
+    any text are as wide as their longest value, and all others (reals, or with
+    NULLs) are 'f8'.
+    """
+    # 'text' > 'real' > 'null' > 'integer' > 'blob', so MAX yields the widest
+    stats: tuple = q.AGGREGATE('COUNT(*)', *(
+        f"MAX(typeof({column})), MAX(LENGTH(CAST({column} AS BLOB)))" \
+        for column in q.columns
+    ))
+    n_rows, stats = stats[0], stats[1:]
+
+    fields: list[tuple[str, str]] = []
+    for column, storage, width in zip(q.columns, stats[::2], stats[1::2]):
+        if storage == 'integer':
+            fields.append((column, 'i8'))
+        elif storage in ('text', 'blob'):
+            fields.append((column, f"S{max(width or 0, 1)}"))
+        else:
+            fields.append((column, 'f8'))
+
+    return np.dtype(fields), n_rows
+
+def to_records(chunk: dict[str, list], dtype: np.dtype) -> np.ndarray:
+    """
+    Converts a chunk of column -> values into an array of records.
+    """
+    records = np.empty(len(next(iter(chunk.values()))), dtype=dtype)
+    for column in dtype.names:
+        records[column] = chunk[column]
+
+    return records
+
+def write_csv(q: Query, stream, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Writes the result of a query to a binary stream as CSV, with a header row.
+    Returns the number of rows written.
+    """
+    from csv import writer
+    from io import TextIOWrapper
+
+    text = TextIOWrapper(stream, encoding='utf-8', newline='', write_through=True)
+    csv_writer = writer(text)
+    csv_writer.writerow(q.columns)
+
+    n_rows: int = 0
+    for chunk in q.STREAM(chunk_size):
+        csv_writer.writerows(zip(*chunk.values()))
+        n_rows += len(chunk[q.columns[0]])
+
+    text.detach()
+    return n_rows
+
+def write_bin(
+    q: Query,
+    stream,
+    dtype: np.dtype,
+    n_expected: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """
+    Writes the result of a query to a binary stream as records of 'dtype' (see
+    'get_layout'). Returns the number of rows written.
+
+    If 'n_expected' is given, the records are preceded by a '.npy' header
+    holding that many rows, and a RuntimeError is raised if the result's size
+    differs.
+    """
+    from numpy.lib import format
+
+    if n_expected is not None:
+        format.write_array_header_1_0(stream, {
+            'descr': format.dtype_to_descr(dtype),
+            'fortran_order': False,
+            'shape': (n_expected,),
+        })
+
+    n_rows: int = 0
+    for chunk in q.STREAM(chunk_size):
+        records = to_records(chunk, dtype)
+        stream.write(records.tobytes())
+        n_rows += records.size
+
+    if (n_expected is not None) and (n_rows != n_expected):
+        raise RuntimeError(
+            f"Expected {n_expected} rows but wrote {n_rows}; the database "
+            "changed during the query"
+        )
+
+    return n_rows
+
+def extract(
+    q: Query,
+    output: Optional[Path] = None,
+    fmt: Format = 'csv',
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> tuple[int, Optional[np.dtype]]:
+    """
+    Streams the result of a query to a file, or to stdout if 'output' is None.
+    A file that could not be written completely is removed.
+
+    Returns the number of rows written and, for binary formats, the record
+    dtype.
+    """
+    dtype: Optional[np.dtype] = None
+
+    stream = sys.stdout.buffer if output is None else open(output, 'wb')
+    try:
+        if fmt == 'csv':
+            n_rows = write_csv(q, stream, chunk_size=chunk_size)
+        else:
+            # The '.npy' header holds the shape, so the rows are counted first
+            dtype, n_expected = get_layout(q)
+            n_rows = write_bin(
+                q, stream, dtype,
+                n_expected = n_expected if fmt == 'npy' else None,
+                chunk_size = chunk_size,
+            )
+        stream.flush()
+    except BaseException:
+        if output is not None:
+            # Do not leave a truncated file behind
+            stream.close()
+            output.unlink(missing_ok=True)
+        raise
+    finally:
+        if output is not None:
+            stream.close()
+
+    return n_rows, dtype
@@ -0,0 +1,486 @@
+"""
+Submodule containing utilities for extrapolating data beyond the highest
+tabulated upper level, n_c.
+
+For each (z, rec_case, temp, dens) and series (n_l), the asymptotic dependence
+on the upper level is fitted to the top tabulated levels:
+
+    log10(val) = c_0 + c_1 * log10(n_u) [+ c_2 / n_u]
+
+Since all series at a grid point share the same fitted levels, every series at
+every grid point is fitted with a single (batched) matrix product, and
+evaluating any range of n_u is a single array computation. Grid points may be
+tabulated up to different levels, in which case each is fitted to its own top
+levels.
+"""
+from typing import Optional, Union, Iterable
+from dataclasses import dataclass
+from functools import lru_cache
+import numpy as np
+
+from ..custom_types import DataType, RecType
+
+# Default number of top tabulated levels used in the fit
+N_FIT: int = 8
+# Highest supported fit order. Stored records always hold the coefficients
+# c_0..c_{MAX_ORDER+1}, NaN-padded, so fits of any order share a table.
+MAX_ORDER: int = 1
+
+def get_basis(
+    n_u: np.ndarray[int],
+    order: int,
+) -> np.ndarray[float]:
+    """
+    Returns the fit's basis functions evaluated at n_u, with shape (n, order+2).
+    """
+    from numpy import asarray, log10, stack, ones_like
+
+    assert 0 <= order <= MAX_ORDER, f"Unsupported fit order {order}"
+
+    n_u = asarray(n_u, dtype=float)
+    columns: list = [ones_like(n_u), log10(n_u)]
+    if order >= 1:
+        columns.append(1 / n_u)
+
+    return stack(columns, axis=-1)
+
+@dataclass(slots=True)
+class Extrapolation:
+    """
+    Fit coefficients, with shape (n_temp, n_dens, n_series, n_coeffs), for the
+    series 'n_ls' at every grid point, fitted to the top 'n_fit' levels (None
+    if unknown, e.g. for records stored before it was). 'n_c' holds the highest
+    fitted level at every grid point, with shape (n_temp, n_dens).
+    """
+    table: DataType
+    rec_case: RecType
+    z: int
+    n_c: np.ndarray[int]
+    order: int
+    n_fit: Optional[int]
+
+    n_ls: np.ndarray[int]
+    temps: np.ndarray[float]
+    denss: np.ndarray[float]
+    coeffs: np.ndarray[float]
+
+    @staticmethod
+    def fit(
+        table: DataType,
+        rec_case: RecType,
+        z: int,
+        n_us: np.ndarray[int],
+        n_ls: np.ndarray[int],
+        temps: np.ndarray[float],
+        denss: np.ndarray[float],
+        values: np.ndarray[float],
+        order: int = 0,
+    ) -> 'Extrapolation':
+        """
+        Fits values with shape (n_temp, n_dens, n_series, n_fit), tabulated at
+        the upper levels 'n_us', by least squares in log space. 'n_us' has
+        shape (n_fit,), or (n_temp, n_dens, n_fit) if the levels differ between
+        grid points. Series with missing values get NaN coefficients.
+        """
+        from numpy import log10, asarray, swapaxes, broadcast_to
+        from numpy.linalg import pinv
+
+        n_us = asarray(n_us, dtype=int)
+        assert values.shape[-1] == n_us.shape[-1]
+        assert n_us.shape[-1] >= order + 2, "Too few levels for the fit"
+
+        # Least squares for all series at once: coeffs = y @ pinv(X).T, with
+        # one X per grid point if the levels differ
+        with np.errstate(divide='ignore', invalid='ignore'):
+            coeffs = log10(values) \
+                @ swapaxes(pinv(get_basis(n_us, order)), -1, -2)
+
+        n_c = broadcast_to(n_us.max(axis=-1), (len(temps), len(denss))).copy()
+
+        return Extrapolation(
+            table, rec_case, z,
+            n_c = n_c,
+            order = order,
+            n_fit = int(n_us.shape[-1]),
+            n_ls = asarray(n_ls, dtype=int),
+            temps = asarray(temps, dtype=float),
+            denss = asarray(denss, dtype=float),
+            coeffs = coeffs,
+        )
+
+    @staticmethod
+    def from_grid(
+        grid,
+        n_fit: int = N_FIT,
+        order: int = 0,
+        n_c: Optional[int] = None,
+    ) -> 'Extrapolation':
+        """
+        Fits a 'Grid', at every grid point, to the top 'n_fit' levels
+        tabulated there (at most n_c, if specified). Only series below all
+        fitted levels are fitted.
+
+        Transitions missing from the grid are NaN, so series missing any of a
+        point's fitted levels get NaN coefficients there, as do points without
+        any data.
+        """
+        from numpy import (
+            arange, full, nan, isfinite, where, concatenate, take_along_axis,
+        )
+
+        n_temp, n_dens, _ = grid.values.shape
+        grid_n_us = grid.transitions[:, 0]
+        grid_n_ls = grid.transitions[:, 1]
+
+        # Highest level tabulated at each point
+        tabulated = isfinite(grid.values)
+        if n_c is not None:
+            tabulated &= grid_n_us <= n_c
+        n_cs = where(tabulated, grid_n_us, 0).max(axis=-1)
+
+        empty = n_cs == 0
+        assert not empty.all(), "No data to fit"
+        # Placeholder levels, whose values are all NaN
+        n_cs[empty] = n_cs.max()
+
+        n_us = n_cs[..., None] - n_fit + 1 + arange(n_fit)
+        n_ls = arange(1, n_us.min())
+        assert n_ls.size > 0, "No series below all fitted levels"
+
+        # Position of every (n_u, n_l) on the grid, or the NaN column if absent
+        positions = full(
+            (grid_n_us.max() + 1, max(grid_n_ls.max(), n_ls[-1]) + 1), -1,
+        )
+        positions[grid_n_us, grid_n_ls] = arange(grid_n_us.size)
+        idxs = positions[n_us[:, :, None, :], n_ls[:, None]]
+        padded = concatenate(
+            [grid.values, full((n_temp, n_dens, 1), nan)], axis=-1,
+        )
+
+        values = take_along_axis(
+            padded, idxs.reshape(n_temp, n_dens, -1), axis=-1,
+        ).reshape(idxs.shape)
+
+        return Extrapolation.fit(
+            grid.table, grid.rec_case, grid.z,
+            n_us = n_us,
+            n_ls = n_ls,
+            temps = grid.temps,
+            denss = grid.denss,
+            values = values,
+            order = order,
+        )
+
+    @staticmethod
+    def from_state(
+        physical_state,
+        n_fit: int = N_FIT,
+        order: int = 0,
+    ) -> 'Extrapolation':
+        """
+        Fits the top 'n_fit' levels, up to n_c, of a 'PhysicalState'.
+        """
+        from numpy import arange, unique, full, nan, searchsorted
+
+        n_c: int = physical_state.n_c
+        n_us = arange(n_c - n_fit + 1, n_c + 1)
+        n_ls = arange(1, n_us[0])
+
+        dblocks = [
+            dblock \
+            for n_u in n_us.tolist() \
+            for dblock in physical_state.findBlocks(n_u=n_u)
+        ]
+        assert len(dblocks) > 0, "No blocks found at the top levels"
+
+        temps = unique([dblock.temp for dblock in dblocks])
+        denss = unique([dblock.dens for dblock in dblocks])
+
+        values = full((temps.size, denss.size, n_ls.size, n_us.size), nan)
+        for dblock in dblocks:
+            sel = dblock.nls < n_us[0]
+            values[
+                searchsorted(temps, dblock.temp),
+                searchsorted(denss, dblock.dens),
+                dblock.nls[sel] - 1,
+                dblock.n_u - n_us[0],
+            ] = dblock.data[sel]
+
+        return Extrapolation.fit(
+            physical_state.data_type, physical_state.rec_case, physical_state.z,
+            n_us = n_us,
+            n_ls = n_ls,
+            temps = temps,
+            denss = denss,
+            values = values,
+            order = order,
+        )
+
+    def evaluate(
+        self,
+        n_u: Iterable[int],
+        n_ls: Optional[Iterable[int]] = None,
+    ) -> np.ndarray[float]:
+        """
+        Evaluates the fits at arbitrary upper levels, returning an array with
+        shape (n_temp, n_dens, n_series, n_u). Values where n_u <= n_l are NaN.
+
+        Raises a KeyError if any of the requested series was not fitted.
+        """
+        from numpy import asarray, nan, isin, searchsorted
+
+        n_u = asarray(n_u, dtype=int).ravel()
+
+        if n_ls is None:
+            n_ls, coeffs = self.n_ls, self.coeffs
+        else:
+            n_ls = asarray(n_ls, dtype=int).ravel()
+            if (missing := n_ls[~isin(n_ls, self.n_ls)]).size > 0:
+                raise KeyError(f"Series n_l = {missing.tolist()} were not fitted")
+
+            coeffs = self.coeffs[..., searchsorted(self.n_ls, n_ls), :]
+
+        out = 10**(coeffs @ get_basis(n_u, self.order).T)
+        out[..., n_u[None, :] <= n_ls[:, None]] = nan
+
+        return out
+
+    def toRecords(self) -> dict[str, np.ndarray]:
+        """
+        Returns the coefficients as column-oriented records, one row per
+        (n_l, temp, dens). Coefficients beyond the fit's order are NaN.
+        """
+        from numpy import meshgrid, full, nan, broadcast_to
+
+        tt, dd, ll = meshgrid(self.temps, self.denss, self.n_ls, indexing='ij')
+        n: int = tt.size
+
+        records: dict = {
+            'rec_case': full(n, self.rec_case),
+            'z':        full(n, self.z),
+            'n_l':      ll.ravel(),
+            'temp':     tt.ravel(),
+            'dens':     dd.ravel(),
+            'n_c':      broadcast_to(self.n_c[..., None], tt.shape).ravel(),
+            'fit_order': full(n, self.order),
+            'n_fit':    full(n, -1 if self.n_fit is None else self.n_fit),
+        }
+        for idx in range(MAX_ORDER + 2):
+            records[f"c{idx}"] = self.coeffs[..., idx].ravel() \
+                if idx < self.coeffs.shape[-1] else full(n, nan)
+
+        return records
+
+    @staticmethod
+    def from_records(
+        table: DataType,
+        records: dict[str, Iterable],
+    ) -> 'Extrapolation':
+        """
+        Recreates an instance from the records of a single (z, rec_case), see
+        'toRecords'.
+        """
+        from numpy import asarray, unique, full, nan, stack
+
+        order: int = int(asarray(records['fit_order'])[0])
+        n_coeffs: int = order + 2
+
+        # Absent (or NULL) in tables stored before it was recorded
+        n_fit = asarray(records.get('n_fit', [-1]), dtype=float)[0]
+        n_fit = int(n_fit) if n_fit > 0 else None
+
+        n_ls, i_l = unique(asarray(records['n_l'], dtype=int), return_inverse=True)
+        temps, i_t = unique(asarray(records['temp'], dtype=float), return_inverse=True)
+        denss, i_d = unique(asarray(records['dens'], dtype=float), return_inverse=True)
+
+        n_c = full((temps.size, denss.size), 0)
+        n_c[i_t, i_d] = asarray(records['n_c'], dtype=int)
+
+        coeffs = full((temps.size, denss.size, n_ls.size, n_coeffs), nan)
+        coeffs[i_t, i_d, i_l] = stack(
+            [asarray(records[f"c{idx}"], dtype=float) for idx in range(n_coeffs)],
+            axis = -1,
+        )
+
+        return Extrapolation(
+            table,
+            asarray(records['rec_case'])[0],
+            int(asarray(records['z'])[0]),
+            n_c = n_c,
+            order = order,
+            n_fit = n_fit,
+            n_ls = n_ls,
+            temps = temps,
+            denss = denss,
+            coeffs = coeffs,
+        )
+
+    def save(
+        self,
+        name: Optional[str] = None,
+    ) -> None:
+        """
+        Stores the coefficients in the '<table>_extrap' table of a database,
+        replacing any previous coefficients of the same (z, rec_case). Columns
+        missing from a table stored by an older version are added.
+        """
+        from pandas import DataFrame
+        from .writing import connect_to_db
+
+        table_name: str = f"{self.table}_extrap"
+        records: dict = self.toRecords()
+
+        _, connection = connect_to_db(name=name, replace=False)
+        try:
+            exists: bool = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                (table_name,),
+            ).fetchone() is not None
+
+            if exists:
+                columns: set[str] = set(
+                    cinfo[1] for cinfo in connection.execute(
+                        f"PRAGMA table_info({table_name})"
+                    )
+                )
+                for column, values in records.items():
+                    if column in columns: continue
+                    decl: str = 'INTEGER' if values.dtype.kind in 'iu' else 'REAL'
+                    connection.execute(
+                        f"ALTER TABLE {table_name} ADD COLUMN {column} {decl}"
+                    )
+
+                connection.execute(
+                    f"DELETE FROM {table_name} WHERE z == ? AND rec_case == ?",
+                    (self.z, self.rec_case),
+                )
+
+            DataFrame(records).to_sql(
+                table_name,
+                connection,
+                if_exists = 'append',
+                index = False,
+            )
+            connection.commit()
+        finally:
+            connection.close()
+
+def load_extrapolation(
+    table: DataType,
+    z: int,
+    rec_case: RecType,
+    name: Optional[str] = None,
+) -> Optional[Extrapolation]:
+    """
+    Reads stored coefficients from a database, returning None if there are
+    none.
+    """
+    from .reading import Query
+
+    with Query.START(name) as q:
+        if f"{table}_extrap" not in q.table_names:
+            return None
+
+        records: dict = q.FROM(f"{table}_extrap") \
+            .SELECT('*') \
+            .WHERE('z', f"z == {int(z)}") \
+            .WHERE('rec_case', f"rec_case == '{rec_case}'") \
+            .STOP()
+
+    if len(records['z']) == 0:
+        return None
+
+    return Extrapolation.from_records(table, records)
+
+def get_extrapolation(
+    table: DataType,
+    z: int,
+    rec_case: RecType,
+    name: Optional[Union[str, Iterable[str]]] = None,
+    n_fit: int = N_FIT,
+    order: int = 0,
+    store: bool = False,
+) -> Extrapolation:
+    """
+    Returns the (cached) extrapolation of a table for a single (z, rec_case).
+
+    Coefficients stored in the database (fitted with the same order and
+    'n_fit') are used if present. Otherwise the top 'n_fit' levels are read and
+    fitted, and the coefficients are stored if 'store' is True. If several
+    databases are queried as one, coefficients are stored in (and read from)
+    the first one.
+    """
+    if (name is not None) and not isinstance(name, str):
+        # Lists of names are not hashable
+        name = tuple(name)
+
+    return _get_extrapolation(
+        table, z, rec_case,
+        name = name,
+        n_fit = n_fit,
+        order = order,
+        store = store,
+    )
+
+@lru_cache(maxsize=64)
+def _get_extrapolation(
+    table: DataType,
+    z: int,
+    rec_case: RecType,
+    name: Optional[Union[str, tuple[str, ...]]],
+    n_fit: int,
+    order: int,
+    store: bool,
+) -> Extrapolation:
+    from numpy import unique, stack, zeros, maximum
+
+    from .reading import Query
+    from .grid import Grid
+
+    store_name: Optional[str] = name if (name is None) or isinstance(name, str) \
+        else name[0]
+
+    stored = load_extrapolation(table, z, rec_case, name=store_name)
+    if (stored is not None) and (stored.order, stored.n_fit) == (order, n_fit):
+        return stored
+
+    # Every block holds the n_l = 1 series, so its rows give the levels
+    # tabulated at each grid point
+    with Query.START(name) as q:
+        levels: dict = q.FROM(table) \
+            .SELECT('temp', 'dens', 'n_u') \
+            .WHERE('z', f"z == {int(z)}") \
+            .WHERE('rec_case', f"rec_case == '{rec_case}'") \
+            .WHERE('n_l', "n_l == 1") \
+            .STOP()
+
+    if len(levels['n_u']) == 0:
+        raise ValueError(
+            f"No '{table}' data found for z={z}, rec_case={rec_case}"
+        )
+
+    _, i_point = unique(
+        stack([levels['temp'], levels['dens']], axis=1),
+        axis = 0,
+        return_inverse = True,
+    )
+    n_cs = zeros(i_point.max() + 1, dtype=int)
+    maximum.at(n_cs, i_point.ravel(), levels['n_u'])
+
+    # The top levels of every grid point, and all series below them
+    lowest: int = int(n_cs.min()) - n_fit + 1
+    grid = Grid.from_query(
+        table, z, rec_case,
+        transitions = [
+            (n_u, n_l) \
+            for n_u in range(lowest, int(n_cs.max()) + 1) \
+            for n_l in range(1, lowest)
+        ],
+        name = name,
+    )
+
+    extrapolation = Extrapolation.from_grid(grid, n_fit=n_fit, order=order)
+    if store:
+        extrapolation.save(name=store_name)
+
+    return extrapolation
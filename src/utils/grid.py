@@ -0,0 +1,304 @@
+"""
+Submodule containing utilities for working with data on the (temp, dens) grid.
+
+A Grid holds the values of one table for a single (z, rec_case) as a dense
+array with shape (n_temp, n_dens, n_transitions), and interpolates them
+bilinearly in (log10 temp, log10 dens).
+"""
+from typing import Optional, Iterable, Union
+from dataclasses import dataclass
+import numpy as np
+
+from ..custom_types import DataType, RecType
+
+Transition = tuple[int, int]
+
+# Tolerance (in dex) when deciding whether a point lies on the grid
+EPS: float = 1e-9
+
+@dataclass(slots=True)
+class Grid:
+    table: DataType
+    rec_case: RecType
+    z: int
+
+    temps: np.ndarray[float]
+    denss: np.ndarray[float]
+    transitions: np.ndarray[int]
+    values: np.ndarray[float]
+
+    def __post_init__(self) -> None:
+        assert self.values.shape == (
+            self.temps.size, self.denss.size, len(self.transitions),
+        )
+
+    @property
+    def log_temps(self) -> np.ndarray[float]:
+        return np.log10(self.temps)
+
+    @property
+    def log_denss(self) -> np.ndarray[float]:
+        return np.log10(self.denss)
+
+    @staticmethod
+    def from_records(
+        table: DataType,
+        rec_case: RecType,
+        z: int,
+        records: dict[str, Iterable],
+    ) -> 'Grid':
+        """
+        Creates a grid from column-oriented records (e.g. the output of
+        'Query.STOP') containing 'n_u', 'n_l', 'temp', 'dens', and 'val'. Grid
+        points missing from the records are NaN.
+        """
+        from numpy import asarray, unique, full, nan, stack
+
+        n_u = asarray(records['n_u'], dtype=int)
+        n_l = asarray(records['n_l'], dtype=int)
+        temp = asarray(records['temp'], dtype=float)
+        dens = asarray(records['dens'], dtype=float)
+        val = asarray(records['val'], dtype=float)
+
+        temps, i_temp = unique(temp, return_inverse=True)
+        denss, i_dens = unique(dens, return_inverse=True)
+        transitions, i_trans = unique(
+            stack([n_u, n_l], axis=1), axis=0, return_inverse=True,
+        )
+
+        values = full((temps.size, denss.size, len(transitions)), nan)
+        values[i_temp, i_dens, i_trans.ravel()] = val
+
+        return Grid(
+            table, rec_case, z,
+            temps = temps,
+            denss = denss,
+            transitions = transitions,
+            values = values,
+        )
+
+    @staticmethod
+    def from_query(
+        table: DataType,
+        z: int,
+        rec_case: RecType,
+        transitions: Optional[Iterable[Transition]] = None,
+        name: Optional[str] = None,
+    ) -> 'Grid':
+        """
+        Reads a grid from a database. If 'transitions' are specified, only
+        those (n_u, n_l) pairs are read.
+
+        Grids of ions removed by 'scaling.compact_database' are scaled from
+        their reference ion, as 'Query' serves them.
+        """
+        from .reading import Query
+
+        with Query.START(name) as q:
+            return Grid.from_open_query(
+                q, table, z, rec_case, transitions=transitions,
+            )
+
+    @staticmethod
+    def from_open_query(
+        q,
+        table: DataType,
+        z: int,
+        rec_case: RecType,
+        transitions: Optional[Iterable[Transition]] = None,
+    ) -> 'Grid':
+        """
+        Like 'from_query', through an already connected (and unused) 'Query'
+        or 'RemoteQuery'.
+        """
+        q = q.FROM(table) \
+            .SELECT('n_u', 'n_l', 'temp', 'dens', 'val') \
+            .WHERE('z', f"z == {int(z)}") \
+            .WHERE('rec_case', f"rec_case == '{rec_case}'")
+
+        if transitions is not None:
+            values: str = ", ".join(
+                f"({int(n_u)}, {int(n_l)})" for n_u, n_l in transitions
+            )
+            q = q.WHERE(['n_u', 'n_l'], f"(n_u, n_l) IN (VALUES {values})")
+
+        records: dict = q.STOP()
+
+        if len(records['val']) == 0:
+            raise ValueError(
+                f"No '{table}' data found for z={z}, rec_case={rec_case}"
+            )
+
+        return Grid.from_records(table, rec_case, z, records)
+
+    def indicesOf(
+        self,
+        transitions: Iterable[Transition],
+    ) -> np.ndarray[int]:
+        """
+        Returns the positions of the specified (n_u, n_l) pairs.
+        """
+        lookup: dict[Transition, int] = dict(
+            (tuple(trans), idx) \
+            for idx, trans in enumerate(self.transitions.tolist())
+        )
+
+        try:
+            return np.array(
+                [lookup[tuple(trans)] for trans in transitions], dtype=int,
+            )
+        except KeyError as e:
+            raise KeyError(f"Transition {e.args[0]} is not on the grid") from e
+
+    def select(
+        self,
+        transitions: Iterable[Transition],
+    ) -> 'Grid':
+        """
+        Returns the sub-grid of the specified (n_u, n_l) pairs.
+        """
+        idxs = self.indicesOf(transitions)
+
+        return Grid(
+            self.table, self.rec_case, self.z,
+            temps = self.temps,
+            denss = self.denss,
+            transitions = self.transitions[idxs],
+            values = self.values[..., idxs],
+        )
+
+    def _locate(
+        self,
+        temp: np.ndarray[float],
+        dens: np.ndarray[float],
+    ) -> tuple[np.ndarray, ...]:
+        """
+        Locates points on the grid, returning the lower cell corner indices,
+        the fractional positions within the cells, and whether each point lies
+        on the grid.
+        """
+        from numpy import log10, clip, searchsorted
+
+        x, y = log10(temp), log10(dens)
+        xs, ys = self.log_temps, self.log_denss
+
+        # Tolerate round-off at the grid's edges
+        inside = (x >= xs[0] - EPS) & (x <= xs[-1] + EPS) \
+            & (y >= ys[0] - EPS) & (y <= ys[-1] + EPS)
+
+        i = clip(searchsorted(xs, x, side='right') - 1, 0, max(xs.size - 2, 0))
+        j = clip(searchsorted(ys, y, side='right') - 1, 0, max(ys.size - 2, 0))
+
+        dx = xs[i + 1] - xs[i] if xs.size > 1 else np.ones_like(x)
+        dy = ys[j + 1] - ys[j] if ys.size > 1 else np.ones_like(y)
+
+        u = (x - xs[i]) / dx if xs.size > 1 else np.zeros_like(x)
+        v = (y - ys[j]) / dy if ys.size > 1 else np.zeros_like(y)
+
+        return i, j, u, v, inside
+
+    def interpolate(
+        self,
+        temp: Union[float, np.ndarray[float]],
+        dens: Union[float, np.ndarray[float]],
+        log_values: bool = True,
+        gradient: bool = False,
+    ) -> Union[np.ndarray[float], tuple[np.ndarray[float], ...]]:
+        """
+        Interpolates all transitions at the specified (temp, dens) points,
+        returning an array with shape (n_points, n_transitions).
+
+        Interpolation is bilinear in (log10 temp, log10 dens), and acts on
+        log10 of the values if 'log_values' is True. Points off the grid are
+        NaN.
+
+        If 'gradient' is True, the analytic derivatives of the interpolant with
+        respect to log10 temp and log10 dens are returned as well, as a tuple
+        (values, d_dlog_temp, d_dlog_dens) of arrays with the same shape.
+        Within a cell these are exact; across cell edges they are those of the
+        cell each point is located in.
+        """
+        from numpy import broadcast_arrays, atleast_1d, log10, log, nan
+
+        temp, dens = broadcast_arrays(
+            atleast_1d(np.asarray(temp, dtype=float)).ravel(),
+            atleast_1d(np.asarray(dens, dtype=float)).ravel(),
+        )
+        i, j, u, v, inside = self._locate(temp, dens)
+
+        if log_values:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                f = log10(self.values)
+        else:
+            f = self.values
+        i1 = np.minimum(i + 1, self.temps.size - 1)
+        j1 = np.minimum(j + 1, self.denss.size - 1)
+        u, v = u[:, None], v[:, None]
+
+        f00, f10, f01, f11 = f[i, j], f[i1, j], f[i, j1], f[i1, j1]
+
+        out = (1 - u) * (1 - v) * f00 \
+            + u * (1 - v) * f10 \
+            + (1 - u) * v * f01 \
+            + u * v * f11
+
+        if log_values: out = 10**out
+        out[~inside] = nan
+
+        if not gradient:
+            return out
+
+        xs, ys = self.log_temps, self.log_denss
+        dx = (xs[i1] - xs[i])[:, None] if xs.size > 1 else 1.
+        dy = (ys[j1] - ys[j])[:, None] if ys.size > 1 else 1.
+
+        d_dx = ((1 - v) * (f10 - f00) + v * (f11 - f01)) / dx
+        d_dy = ((1 - u) * (f01 - f00) + u * (f11 - f10)) / dy
+
+        # d(10^f) = 10^f ln(10) df
+        if log_values:
+            d_dx = out * log(10) * d_dx
+            d_dy = out * log(10) * d_dy
+        d_dx[~inside] = nan
+        d_dy[~inside] = nan
+
+        return out, d_dx, d_dy
+
+    def refine(
+        self,
+        factor: int,
+        log_values: bool = True,
+    ) -> 'Grid':
+        """
+        Returns a grid with 'factor' times finer temp and dens axes,
+        interpolated from this one. Each cell is divided into 'factor' equal
+        (log-spaced) steps, so the original nodes are kept even if the axes are
+        not log-uniform.
+        """
+        from numpy import arange, meshgrid, append, log10, diff
+
+        def refine_axis(axis: np.ndarray) -> np.ndarray:
+            if axis.size < 2: return axis
+
+            log_axis = log10(axis)
+            steps = arange(factor) / factor
+            refined = 10**(log_axis[:-1, None] + steps * diff(log_axis)[:, None])
+
+            # The original nodes, exactly
+            refined[:, 0] = axis[:-1]
+            return append(refined.ravel(), axis[-1])
+
+        temps = refine_axis(self.temps)
+        denss = refine_axis(self.denss)
+
+        tt, dd = meshgrid(temps, denss, indexing='ij')
+        values = self.interpolate(tt, dd, log_values=log_values) \
+            .reshape(temps.size, denss.size, -1)
+
+        return Grid(
+            self.table, self.rec_case, self.z,
+            temps = temps,
+            denss = denss,
+            transitions = self.transitions,
+            values = values,
+        )
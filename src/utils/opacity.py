@@ -0,0 +1,183 @@
+"""
+Submodule containing utilities for correcting emissivities for line opacity.
+
+The optical depth of each transition follows either from a column density,
+
+    tau = opa * column,
+
+or from the optical depth of a reference transition,
+
+    tau = tau_ref * opa / opa_ref,
+
+and emissivities are scaled by the escape probability beta = (1 - e^-tau) / tau.
+
+The 'emi' and 'opa' grids are stacked into a single grid, so that both are
+interpolated in one call, and the per-transition opacity factors (relative to
+the reference, if any) are computed once, on the grid.
+"""
+from typing import Optional, Iterable, Union
+from dataclasses import dataclass
+import numpy as np
+
+from ..custom_types import RecType
+from .grid import Grid, Transition
+
+ArrayLike = Union[float, Iterable[float], np.ndarray]
+
+def escape_probability(tau: np.ndarray[float]) -> np.ndarray[float]:
+    """
+    Returns the escape probability (1 - e^-tau) / tau, which tends to 1 in the
+    optically thin limit.
+    """
+    from numpy import asarray, expm1, where
+
+    tau = asarray(tau, dtype=float)
+    thin = tau == 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return where(thin, 1., -expm1(-tau) / where(thin, 1., tau))
+
+@dataclass(slots=True)
+class OpacityCorrection:
+    """
+    Emissivities and opacity factors of the same transitions, stacked along the
+    last axis of a single grid: the first half holds 'emi', the second half
+    holds 'opa' (divided by the reference transition's 'opa', if any).
+    """
+    z: int
+    rec_case: RecType
+    transitions: np.ndarray[int]
+    grid: Grid
+    reference: Optional[Transition] = None
+
+    @staticmethod
+    def from_grids(
+        emi: Grid,
+        opa: Grid,
+        reference: Optional[Transition] = None,
+    ) -> 'OpacityCorrection':
+        """
+        Combines an 'emi' and an 'opa' grid, keeping the transitions present in
+        both. If 'reference' is given, opacity factors are stored relative to
+        it, for use with reference optical depths.
+        """
+        from numpy import concatenate, allclose, errstate
+
+        assert allclose(emi.temps, opa.temps) and allclose(emi.denss, opa.denss), \
+            "The 'emi' and 'opa' grids do not share the same (temp, dens) points"
+
+        opa_set = set(map(tuple, opa.transitions.tolist()))
+        transitions: list[Transition] = [
+            trans for trans in map(tuple, emi.transitions.tolist()) \
+            if trans in opa_set
+        ]
+        assert len(transitions) > 0, "No transitions common to 'emi' and 'opa'"
+
+        emi_values = emi.values[..., emi.indicesOf(transitions)]
+        opa_values = opa.values[..., opa.indicesOf(transitions)]
+
+        if reference is not None:
+            reference = tuple(int(n) for n in reference)
+            (ref_idx,) = opa.indicesOf([reference])
+            with errstate(divide='ignore', invalid='ignore'):
+                opa_values = opa_values / opa.values[..., ref_idx, None]
+
+        stacked = Grid(
+            'emi', emi.rec_case, emi.z,
+            temps = emi.temps,
+            denss = emi.denss,
+            transitions = concatenate([transitions, transitions]),
+            values = concatenate([emi_values, opa_values], axis=-1),
+        )
+
+        return OpacityCorrection(
+            emi.z, emi.rec_case,
+            transitions = np.array(transitions, dtype=int),
+            grid = stacked,
+            reference = reference,
+        )
+
+    @staticmethod
+    def from_query(
+        z: int,
+        rec_case: RecType,
+        transitions: Optional[Iterable[Transition]] = None,
+        reference: Optional[Transition] = None,
+        name: Optional[str] = None,
+    ) -> 'OpacityCorrection':
+        """
+        Reads the 'emi' and 'opa' grids from a database. If 'transitions' are
+        specified, only those (n_u, n_l) pairs (and the reference) are read.
+        """
+        if (transitions is not None) and (reference is not None):
+            transitions = list(transitions) + [tuple(reference)]
+
+        return OpacityCorrection.from_grids(
+            Grid.from_query('emi', z, rec_case, transitions=transitions, name=name),
+            Grid.from_query('opa', z, rec_case, transitions=transitions, name=name),
+            reference = reference,
+        )
+
+    def interpolate(
+        self,
+        temp: ArrayLike,
+        dens: ArrayLike,
+        log_values: bool = True,
+    ) -> tuple[np.ndarray[float], np.ndarray[float]]:
+        """
+        Interpolates the emissivities and opacity factors at the (temp, dens)
+        points in a single call, returning two arrays with shape (n_points,
+        n_transitions).
+        """
+        values = self.grid.interpolate(temp, dens, log_values=log_values)
+        n: int = len(self.transitions)
+
+        return values[:, :n], values[:, n:]
+
+    def opticalDepths(
+        self,
+        opa: np.ndarray[float],
+        column: Optional[ArrayLike] = None,
+        tau_ref: Optional[ArrayLike] = None,
+    ) -> np.ndarray[float]:
+        """
+        Returns the optical depths of every transition, given interpolated
+        opacity factors and either column densities or reference optical
+        depths. Both may be given per point, with shape (n_points,), or per
+        point and transition, with shape (n_points, n_transitions).
+        """
+        from numpy import asarray
+
+        if (column is None) == (tau_ref is None):
+            raise ValueError("Specify exactly one of 'column' or 'tau_ref'")
+
+        if column is not None:
+            assert self.reference is None, \
+                "Opacity factors are relative to the reference transition"
+            scale = asarray(column, dtype=float)
+        else:
+            assert self.reference is not None, \
+                "Reference optical depths require a reference transition"
+            scale = asarray(tau_ref, dtype=float)
+
+        if scale.ndim == 1: scale = scale[:, None]
+
+        return opa * scale
+
+    def correct(
+        self,
+        temp: ArrayLike,
+        dens: ArrayLike,
+        column: Optional[ArrayLike] = None,
+        tau_ref: Optional[ArrayLike] = None,
+        log_values: bool = True,
+    ) -> np.ndarray[float]:
+        """
+        Returns the emissivities at the (temp, dens) points corrected by the
+        escape probability, with shape (n_points, n_transitions). Points off
+        the grid are NaN.
+        """
+        emi, opa = self.interpolate(temp, dens, log_values=log_values)
+        tau = self.opticalDepths(opa, column=column, tau_ref=tau_ref)
+
+        return emi * escape_probability(tau)
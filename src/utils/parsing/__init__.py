@@ -2,4 +2,6 @@
 Submodule containing utilities for reading data files.
 """
 from .data_block import DataBlock
-from .physical_state import PhysicalState
\ No newline at end of file
+from .block_store import BlockStore
+from .physical_state import PhysicalState
+from .block_index import BlockIndex
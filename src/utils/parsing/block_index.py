@@ -0,0 +1,218 @@
+"""
+BlockIndex class.
+"""
+from typing import Optional, Union, Iterable
+from dataclasses import dataclass, field
+import numpy as np
+
+from ...custom_types import DataType
+from .data_block import DataBlock, parse_header
+
+DTYPE_LETTERS: dict[DataType, str] = {
+    'emi': 'E',
+    'rec': 'R',
+    'opa': 'A',
+    'dep': 'B',
+}
+
+@dataclass(slots=True)
+class BlockIndex:
+    """
+    Index over the blocks of a data file.
+
+    Block 'i' spans 'start[i]:stop[i]' (header included) of the source it was
+    indexed from, i.e. lines (see 'from_lines') or byte offsets (see
+    'from_bytes'), and its header is described by 'data_type[i]', 'n_u[i]',
+    'temp[i]', and 'dens[i]'. Blocks are not decoded; see 'decode'.
+    """
+    data_type: list[DataType]
+    n_u: np.ndarray[int]
+    temp: np.ndarray[float]
+    dens: np.ndarray[float]
+
+    start: np.ndarray[int]
+    stop: np.ndarray[int]
+
+    _lookup: dict = field(
+        default_factory=dict, init=False, repr=False, compare=False,
+    )
+
+    def __post_init__(self) -> None:
+        for idx, key in enumerate(zip(
+            self.data_type,
+            self.n_u.tolist(),
+            self.temp.tolist(),
+            self.dens.tolist(),
+        )):
+            self._lookup.setdefault(key, idx)
+
+    def __len__(self) -> int:
+        return len(self.data_type)
+
+    @staticmethod
+    def from_lines(
+        lines: list[str],
+        data_types: Optional[Iterable[DataType]] = None,
+    ) -> 'BlockIndex':
+        """
+        Scans the lines of a data file once, recording where each block of the
+        specified data types (all by default) starts and stops. Only header
+        lines are parsed.
+
+        A block starts at a header line and ends at the next line starting with
+        a letter (or at the end of the file).
+        """
+        from numpy import array
+
+        if data_types is None: data_types = DTYPE_LETTERS.keys()
+        letters: set[str] = {DTYPE_LETTERS[dtype] for dtype in data_types}
+
+        headers: list[tuple] = []
+        start: list[int] = []
+        stop: list[int] = []
+
+        # The first two lines are the file's header
+        for idx in range(2, len(lines)):
+            line: str = lines[idx].strip()
+
+            if not line[0].isalpha(): continue
+
+            if len(stop) < len(start):
+                # End current block
+                stop.append(idx)
+
+            if (line[0].upper() in letters) and not line.startswith('BNS'):
+                # Start new block
+                headers.append(parse_header(line))
+                start.append(idx)
+
+        if len(stop) < len(start):
+            stop.append(len(lines))
+
+        return BlockIndex(
+            data_type = [hdr[5] for hdr in headers],
+            n_u  = array([hdr[3] for hdr in headers], dtype=int),
+            temp = array([hdr[1] for hdr in headers], dtype=float),
+            dens = array([hdr[0] for hdr in headers], dtype=float),
+            start = array(start, dtype=int),
+            stop  = array(stop, dtype=int),
+        )
+
+    @staticmethod
+    def from_bytes(
+        data: bytes,
+        data_types: Optional[Iterable[DataType]] = None,
+    ) -> 'BlockIndex':
+        """
+        Scans the (decompressed) bytes of a data file once, recording the byte
+        offsets at which each block of the specified data types (all by
+        default) starts and stops, with the same rules as 'from_lines'. Only
+        header lines are decoded.
+        """
+        from re import compile, MULTILINE
+        from numpy import array
+
+        if data_types is None: data_types = DTYPE_LETTERS.keys()
+        letters: set[bytes] = {
+            DTYPE_LETTERS[dtype].encode('ascii') for dtype in data_types
+        }
+
+        headers: list[tuple] = []
+        start: list[int] = []
+        stop: list[int] = []
+
+        # The first two lines are the file's header
+        offset: int = data.find(b'\n', data.find(b'\n') + 1) + 1
+
+        for match in compile(rb'^[ \t]*[A-Za-z]', MULTILINE).finditer(data, offset):
+            idx: int = match.start()
+
+            if len(stop) < len(start):
+                # End current block
+                stop.append(idx)
+
+            letter: bytes = data[match.end() - 1:match.end()]
+            if (letter.upper() in letters) \
+                    and not data.startswith(b'BNS', match.end() - 1):
+                # Start new block
+                eol: int = data.find(b'\n', idx)
+                line: bytes = data[idx:eol if eol >= 0 else len(data)]
+                headers.append(parse_header(line.decode('ascii')))
+                start.append(idx)
+
+        if len(stop) < len(start):
+            stop.append(len(data))
+
+        return BlockIndex(
+            data_type = [hdr[5] for hdr in headers],
+            n_u  = array([hdr[3] for hdr in headers], dtype=int),
+            temp = array([hdr[1] for hdr in headers], dtype=float),
+            dens = array([hdr[0] for hdr in headers], dtype=float),
+            start = array(start, dtype=int),
+            stop  = array(stop, dtype=int),
+        )
+
+    def select(self, data_type: DataType) -> 'BlockIndex':
+        """
+        Returns the sub-index of blocks with the specified data type.
+        """
+        from numpy import array
+
+        sel = array([dtype == data_type for dtype in self.data_type], dtype=bool)
+
+        return BlockIndex(
+            data_type = [data_type] * int(sel.sum()),
+            n_u  = self.n_u[sel],
+            temp = self.temp[sel],
+            dens = self.dens[sel],
+            start = self.start[sel],
+            stop  = self.stop[sel],
+        )
+
+    def locate(
+        self,
+        data_type: DataType,
+        n_u: int,
+        temp: float,
+        dens: float,
+    ) -> int:
+        """
+        Returns the position of the block with the specified header.
+        """
+        key = (data_type, n_u, temp, dens)
+        if key not in self._lookup:
+            raise KeyError(f"No block with header {key}")
+
+        return self._lookup[key]
+
+    def find(
+        self,
+        n_u: Optional[int] = None,
+        temp: Optional[float] = None,
+        dens: Optional[float] = None,
+    ) -> list[int]:
+        """
+        Returns the positions of all blocks matching the specified header
+        values. Unspecified values match any block.
+        """
+        from numpy import ones, flatnonzero
+
+        sel = ones(len(self), dtype=bool)
+        if n_u is not None:  sel &= (self.n_u == n_u)
+        if temp is not None: sel &= (self.temp == temp)
+        if dens is not None: sel &= (self.dens == dens)
+
+        return flatnonzero(sel).tolist()
+
+    def decode(
+        self,
+        source: Union[list[str], bytes],
+        idx: int,
+    ) -> DataBlock:
+        """
+        Decodes the idx'th block from the lines or bytes it was indexed from.
+        """
+        if isinstance(source, bytes):
+            return DataBlock.from_bytes(source[self.start[idx]:self.stop[idx]])
+
+        return DataBlock.from_lines(source[self.start[idx]:self.stop[idx]])
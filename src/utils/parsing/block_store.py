@@ -0,0 +1,136 @@
+"""
+BlockStore class.
+"""
+from typing import Iterator
+from dataclasses import dataclass
+import numpy as np
+
+from ...custom_types import RecType, DataType
+from .data_block import DataBlock, NL_DTYPE, VAL_DTYPE
+
+ARRAY_NAMES: tuple[str] = ('n_u', 'temp', 'dens', 'offsets', 'nls', 'data')
+
+@dataclass(slots=True)
+class BlockStore:
+    """
+    Contiguous storage for the data blocks of a single physical state.
+
+    Instead of many small arrays (two per block), the decoded values of all
+    blocks are concatenated into one pair of arrays. Block 'i' occupies the
+    slice 'offsets[i]:offsets[i+1]' of 'nls' and 'data', while its header is
+    stored at index 'i' of 'n_u', 'temp', and 'dens'.
+    """
+    rec_case: RecType
+    z: int
+    data_type: DataType
+
+    n_u: np.ndarray[int]
+    temp: np.ndarray[float]
+    dens: np.ndarray[float]
+
+    offsets: np.ndarray[int]
+    nls: np.ndarray[int]
+    data: np.ndarray[float]
+
+    def __len__(self) -> int:
+        return self.n_u.size
+
+    def __iter__(self) -> Iterator[DataBlock]:
+        return (self.getBlock(idx) for idx in range(len(self)))
+
+    @staticmethod
+    def from_blocks(blocks: list[DataBlock]) -> 'BlockStore':
+        """
+        Moves the data of decoded blocks into a single contiguous store.
+        """
+        from numpy import array, concatenate, cumsum, zeros
+
+        assert len(blocks) > 0
+        assert all(dblock.data is not None for dblock in blocks)
+
+        first: DataBlock = blocks[0]
+
+        offsets = zeros(len(blocks) + 1, dtype=np.int64)
+        offsets[1:] = cumsum([dblock.nls.size for dblock in blocks])
+
+        return BlockStore(
+            first.rec_case, first.z, first.data_type,
+            n_u  = array([dblock.n_u for dblock in blocks], dtype=NL_DTYPE),
+            temp = array([dblock.temp for dblock in blocks], dtype=float),
+            dens = array([dblock.dens for dblock in blocks], dtype=float),
+            offsets = offsets,
+            nls  = concatenate([dblock.nls for dblock in blocks]) \
+                .astype(NL_DTYPE, copy=False),
+            data = concatenate([dblock.data for dblock in blocks]) \
+                .astype(VAL_DTYPE, copy=False),
+        )
+
+    @staticmethod
+    def from_arrays(
+        rec_case: RecType,
+        z: int,
+        data_type: DataType,
+        arrays: dict[str, np.ndarray],
+    ) -> 'BlockStore':
+        """
+        Recreates a store from the arrays returned by 'toArrays'.
+        """
+        return BlockStore(
+            rec_case, z, data_type,
+            **dict((name, arrays[name]) for name in ARRAY_NAMES),
+        )
+
+    def toArrays(self) -> dict[str, np.ndarray]:
+        """
+        Returns the store's arrays, e.g. for saving them with 'numpy.savez'.
+        """
+        return dict((name, getattr(self, name)) for name in ARRAY_NAMES)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Total size of the stored arrays in bytes.
+        """
+        return sum(arr.nbytes for arr in self.toArrays().values())
+
+    def getBlock(self, idx: int) -> DataBlock:
+        """
+        Returns the idx'th block. Its arrays are views into the store.
+        """
+        sel = slice(self.offsets[idx], self.offsets[idx + 1])
+
+        return DataBlock(
+            float(self.dens[idx]), float(self.temp[idx]),
+            self.z, int(self.n_u[idx]), self.rec_case, self.data_type,
+            nls  = self.nls[sel],
+            data = self.data[sel],
+        )
+
+    def appendToDict(self, d: dict) -> dict:
+        """
+        Appends the store's data to a dictionary, without creating any
+        intermediate blocks.
+        """
+        from itertools import repeat
+        from numpy import diff, repeat as np_repeat
+        from ..funcs import calculateWave
+
+        n: int = self.nls.size
+        counts: np.ndarray[int] = diff(self.offsets)
+        n_u: np.ndarray[int] = np_repeat(self.n_u.astype(int), counts)
+
+        if self.data_type == 'emi':
+            d['wave'].extend(
+                calculateWave(int(nl), int(nu), self.z) \
+                for nl, nu in zip(self.nls, n_u)
+            )
+
+        d['rec_case'].extend(repeat(self.rec_case, n))
+        d['z']       .extend(repeat(self.z, n))
+        d['n_u']     .extend(n_u)
+        d['n_l']     .extend(self.nls)
+        d['temp']    .extend(np_repeat(self.temp, counts))
+        d['dens']    .extend(np_repeat(self.dens, counts))
+        d['val']     .extend(self.data)
+
+        return d
@@ -6,6 +6,10 @@ import numpy as np
 
 from ...custom_types import RecType, DataType
 
+# Narrowest dtypes able to hold SH1995 values losslessly
+NL_DTYPE:  type = np.int16
+VAL_DTYPE: type = np.float64
+
 def parse_int(s: str) -> int:
     return int(s)
 
@@ -14,7 +18,65 @@ def parse_float(s: str) -> float:
     pwr: str = s[-4:].removeprefix('E')
     return float(f"{mantissa}E{pwr}")
 
-@dataclass
+def parse_words(body: bytes) -> tuple[np.ndarray[int], np.ndarray[float]]:
+    """
+    Parses the data lines of a block directly from bytes. All 13-character 
+    words are gathered into one array and decoded at once, following the same
+    rules as 'parse_int' and 'parse_float'.
+    """
+    from numpy import frombuffer, empty, uint8
+
+    words: bytes = b''.join(
+        line[1:1 + 13 * ((len(line) - 1) // 13)] \
+        for line in body.split(b'\n')
+    )
+    chars: np.ndarray = frombuffer(words, dtype=uint8).reshape(-1, 13)
+
+    nls: np.ndarray[int] = chars[:, :3].copy().view('S3').ravel() \
+        .astype(NL_DTYPE)
+
+    # Rebuild '<mantissa>E<exponent>', dropping the exponent's own 'E' prefix
+    exponent: np.ndarray = chars[:, 9:]
+    has_prefix: np.ndarray[bool] = (exponent[:, 0] == ord('E'))
+
+    floats: np.ndarray = empty((chars.shape[0], 10), dtype=uint8)
+    floats[:, :5] = chars[:, 4:9]
+    floats[:, 5] = ord('E')
+    floats[:, 6:] = exponent
+    floats[has_prefix, 6:9] = exponent[has_prefix, 1:]
+    floats[has_prefix, 9] = 0
+
+    data: np.ndarray[float] = floats.view('S10').ravel().astype(VAL_DTYPE)
+
+    return nls, data
+
+def parse_header(hdr: str) -> tuple[float, float, int, int, RecType, DataType]:
+    """
+    Parses a block's header line, returning (dens, temp, z, n_u, rec_case, 
+    data_type).
+    """
+    hdr_elements: dict = {}
+    for elem in hdr.replace('= ', '=').strip().split():
+        key, val = elem.split('=')
+        hdr_elements[key] = val
+
+    dens: float = float(hdr_elements.pop('NE'))
+    temp: float = float(hdr_elements.pop('TE'))
+
+    z:        int = int(hdr_elements.pop('Z'))
+    rec_case: str = hdr_elements.pop('CASE')
+
+    match (_data_type := hdr_elements.popitem())[0].split('_')[0]:
+        case 'E': data_type = 'emi' # Emissivities
+        case 'R': data_type = 'rec' # Recombination coefficients
+        case 'A': data_type = 'opa' # Opacity factors
+        case 'B': data_type = 'dep' # Departure coefficients
+
+    n_u: int = int(_data_type[1])
+
+    return dens, temp, z, n_u, rec_case, data_type
+
+@dataclass(slots=True)
 class DataBlock:
     dens: float
     temp: float
@@ -42,32 +104,26 @@ class DataBlock:
 
     @staticmethod
     def from_lines(lines: list[str]) -> 'DataBlock':
-        hdr: str = lines[0]
-
-        hdr_elements: dict = {}
-        for elem in hdr.replace('= ', '=').strip().split():
-            key, val = elem.split('=')
-            hdr_elements[key] = val
-
-        dens: float = float(hdr_elements.pop('NE'))
-        temp: float = float(hdr_elements.pop('TE'))
-
-        z:        int = int(hdr_elements.pop('Z'))
-        rec_case: str = hdr_elements.pop('CASE')
-
-        match (_data_type := hdr_elements.popitem())[0].split('_')[0]:
-            case 'E': data_type = 'emi' # Emissivities
-            case 'R': data_type = 'rec' # Recombination coefficients
-            case 'A': data_type = 'opa' # Opacity factors
-            case 'B': data_type = 'dep' # Departure coefficients
-
-        n_u: int = int(_data_type[1])
-
         return DataBlock(
-            dens, temp, z, n_u, rec_case, data_type,
+            *parse_header(lines[0]),
             raw_data = lines[1:],
         ).processRawData()
     
+    @staticmethod
+    def from_bytes(block: bytes) -> 'DataBlock':
+        """
+        Parses a block (header line included) without decoding its data lines
+        into strings.
+        """
+        hdr, _, body = block.partition(b'\n')
+        nls, data = parse_words(body)
+
+        return DataBlock(
+            *parse_header(hdr.decode('ascii')),
+            nls = nls,
+            data = data,
+        )
+
     @property
     def sorting_key(self) -> tuple[float]:
         return (
@@ -82,6 +138,8 @@ class DataBlock:
         - n_l:   3 characters
         - space: 1 character
         - valie: 9 characters
+
+        The raw lines are released once decoded.
         """
         from numpy import array
 
@@ -113,8 +171,11 @@ class DataBlock:
                 f"{len(nls)} = {len(data)} ({self.n_u=})"
             )
 
-        self.nls: np.ndarray[int]    = array(nls, dtype=int)
-        self.data: np.ndarray[float] = array(data, dtype=float)
+        self.nls: np.ndarray[int]    = array(nls, dtype=NL_DTYPE)
+        self.data: np.ndarray[float] = array(data, dtype=VAL_DTYPE)
+
+        # The raw text is no longer needed once decoded
+        self.raw_data = None
 
         return self
     
@@ -138,7 +199,9 @@ class DataBlock:
         n: int = self.nls.size
 
         if self.data_type == 'emi':
-            d['wave'].extend(calculateWave(nl, self.n_u, self.z) for nl in self.nls)
+            d['wave'].extend(
+                calculateWave(int(nl), self.n_u, self.z) for nl in self.nls
+            )
 
         d['rec_case'].extend(repeat(self.rec_case, n))
         d['z']       .extend(repeat(self.z, n))
@@ -1,25 +1,53 @@
 """
 PhysicalState class.
 """
-from typing import Literal, Optional
-from dataclasses import dataclass
+from typing import Literal, Optional, Union, Iterator, Iterable
+from dataclasses import dataclass, field
 from pandas import DataFrame
 
+from ...custom_types import DataType
 from .data_block import DataBlock
+from .block_store import BlockStore
+from .block_index import BlockIndex, DTYPE_LETTERS
 
-@dataclass
+@dataclass(slots=True)
 class PhysicalState:
     rec_case: Literal['A', 'B']
     z: int
     n_c: Optional[int] = None
 
     data_blocks: Optional[list] = None
+    store: Optional[BlockStore] = None
+
+    # Lazy mode: blocks are decoded from 'source' (the file's lines or bytes)
+    # on first access
+    data_type: Optional[DataType] = None
+    index: Optional[BlockIndex] = None
+    source: Optional[Union[list[str], bytes]] = field(default=None, repr=False)
+    memoize: bool = True
+
+    _cache: dict[int, DataBlock] = field(
+        default_factory=dict, init=False, repr=False, compare=False,
+    )
+    _stats: Optional[dict] = field(
+        default=None, init=False, repr=False, compare=False,
+    )
 
     @staticmethod
     def from_lines(
         lines: list[str], 
         data_type: Literal['emi', 'rec', 'opa', 'dep'],
+        compact: bool = False,
+        lazy: bool = False,
+        memoize: bool = True,
     ) -> 'PhysicalState':
+        """
+        Parses the blocks of the specified data type. If 'compact' is True, the
+        blocks are moved into a single contiguous store.
+
+        If 'lazy' is True, the lines are only scanned for block headers and each
+        block is decoded when first accessed (and kept if 'memoize' is True).
+        """
 
         hdr: list[str] = lines[1].strip().split()
         z:        int = int(hdr[1])
@@ -27,51 +55,188 @@ class PhysicalState:
         n_c:      int = int(hdr[4])
         
         physical_state = PhysicalState(
-            z, rec_case,
+            rec_case, z,
             n_c = n_c,
+            data_type = data_type,
+            index = BlockIndex.from_lines(lines, data_types=(data_type,)),
+            source = lines,
+            memoize = memoize,
         )
-        _lines: list[str] = None
 
-        match data_type:
-            case 'emi': dtype = 'E'
-            case 'rec': dtype = 'R'
-            case 'opa': dtype = 'A'
-            case 'dep': dtype = 'B'
-        
-        idx: int = 2
-        while True:
-            if idx >= len(lines): break
+        if lazy:
+            return physical_state
+
+        return physical_state.compact() if compact \
+            else physical_state.decodeAll()
+
+    @staticmethod
+    def from_bytes(
+        data: bytes,
+        data_type: DataType,
+        compact: bool = False,
+        lazy: bool = False,
+        memoize: bool = True,
+    ) -> 'PhysicalState':
+        """
+        Like 'from_lines', from the (decompressed) bytes of a data file, e.g.
+        those of 'writing.unzip_bytes'. In lazy mode only the bytes and the
+        index are held, rather than the file's lines as strings.
+        """
+        hdr: list[bytes] = data.split(b'\n', 2)[1].split()
+        z:        int = int(hdr[1])
+        rec_case: str = hdr[3].decode('ascii')
+        n_c:      int = int(hdr[4])
+
+        physical_state = PhysicalState(
+            rec_case, z,
+            n_c = n_c,
+            data_type = data_type,
+            index = BlockIndex.from_bytes(data, data_types=(data_type,)),
+            source = data,
+            memoize = memoize,
+        )
 
-            line = lines[idx]
+        if lazy:
+            return physical_state
 
-            if _lines is None:
-                # No current group of lines selected    
-                if (line.strip()[0].upper() == dtype) \
-                    and not (line.strip().startswith('BNS')):
-                    _lines = [line]
+        return physical_state.compact() if compact \
+            else physical_state.decodeAll()
 
-                idx += 1
-                continue
+    @staticmethod
+    def from_chunks(
+        chunks: Iterable[bytes],
+        data_types: Optional[Iterable[DataType]] = None,
+        compact: bool = False,
+    ) -> dict[DataType, 'PhysicalState']:
+        """
+        Parses a data file streamed as byte chunks (see 'stream_datafile'): the
+        file's two header lines followed by one chunk per block. All requested
+        data types (all by default) are parsed in a single pass.
+        """
+        chunks = iter(chunks)
+
+        hdr: list[bytes] = next(chunks).split(b'\n')[1].split()
+        z:        int = int(hdr[1])
+        rec_case: str = hdr[3].decode('ascii')
+        n_c:      int = int(hdr[4])
+
+        if data_types is None: data_types = DTYPE_LETTERS.keys()
+        letters: dict[bytes, DataType] = dict(
+            (DTYPE_LETTERS[dtype].encode('ascii'), dtype) \
+            for dtype in data_types
+        )
+
+        physical_states: dict[DataType, PhysicalState] = dict(
+            (dtype, PhysicalState(rec_case, z, n_c=n_c, data_type=dtype)) \
+            for dtype in letters.values()
+        )
+
+        for chunk in chunks:
+            start: bytes = chunk.lstrip()
+            if start.startswith(b'BNS'): continue
+            if (dtype := letters.get(start[:1].upper())) is None: continue
+
+            physical_state = physical_states[dtype]
+            if physical_state.data_blocks is None:
+                physical_state.data_blocks = []
 
-            else:
-                # Current group of lines selected
-                if line.strip()[0].isalpha():
-                    # End current block, reset group of lines, repeat
-                    block = DataBlock.from_lines(_lines)
+            physical_state.data_blocks.append(DataBlock.from_bytes(start))
 
-                    if physical_state.data_blocks is None:
-                        physical_state.data_blocks = []
+        if compact:
+            for physical_state in physical_states.values():
+                physical_state.compact()
 
-                    physical_state.data_blocks.append(block)
-                    _lines = None
+        return physical_states
 
-                    continue
+    @property
+    def is_lazy(self) -> bool:
+        return self.index is not None
 
-                _lines.append(line)
-                idx += 1
-                continue
+    def decodeAll(self) -> 'PhysicalState':
+        """
+        Decodes every block of a lazy instance, releasing its source.
+        """
+        if self.is_lazy:
+            if len(self.index) > 0:
+                self.data_blocks = list(self.iterBlocks())
 
-        return physical_state
+            self.index = None
+            self.source = None
+            self._cache.clear()
+
+        return self
+
+    def compact(self) -> 'PhysicalState':
+        """
+        Moves the data of all blocks into a single contiguous store, releasing
+        the individual blocks. Lazy instances are fully decoded first.
+        """
+        self.decodeAll()
+
+        if self.data_blocks is not None:
+            self.store = BlockStore.from_blocks(self.data_blocks)
+            self.data_blocks = None
+
+        return self
+
+    def getBlock(self, idx: int) -> DataBlock:
+        """
+        Returns the idx'th block, decoding it first if necessary.
+        """
+        if not self.is_lazy:
+            if self.store is not None:
+                return self.store.getBlock(idx)
+
+            assert self.data_blocks is not None
+
+            return self.data_blocks[idx]
+
+        if idx in self._cache:
+            return self._cache[idx]
+
+        dblock: DataBlock = self.index.decode(self.source, idx)
+        if self.memoize:
+            self._cache[idx] = dblock
+
+        return dblock
+
+    def findBlocks(
+        self,
+        n_u: Optional[int] = None,
+        temp: Optional[float] = None,
+        dens: Optional[float] = None,
+    ) -> list[DataBlock]:
+        """
+        Returns the blocks matching the specified header values. In lazy mode,
+        only the matching blocks are decoded.
+        """
+        if self.is_lazy:
+            return [
+                self.getBlock(idx) \
+                for idx in self.index.find(n_u=n_u, temp=temp, dens=dens)
+            ]
+
+        return [
+            dblock \
+            for dblock in self.iterBlocks() \
+            if (n_u is None or dblock.n_u == n_u) \
+                and (temp is None or dblock.temp == temp) \
+                and (dens is None or dblock.dens == dens)
+        ]
+
+    def iterBlocks(self) -> Iterator[DataBlock]:
+        """
+        Iterates over the instance's blocks, regardless of how they are stored.
+        """
+        if self.is_lazy:
+            return (self.getBlock(idx) for idx in range(len(self.index)))
+
+        if self.store is not None:
+            return iter(self.store)
+
+        assert self.data_blocks is not None
+
+        return iter(self.data_blocks)
     
     def getStats(
         self,
@@ -81,12 +246,10 @@ class PhysicalState:
         """
         from collections import defaultdict
 
-        assert self.data_blocks is not None
-
         self._stats: dict[tuple[float, float], dict[tuple[int, int], float]] = \
             defaultdict(lambda: {})
 
-        for dblock in self.data_blocks:
+        for dblock in self.iterBlocks():
             key1 = (dblock.temp, dblock.dens)
             for nl, stat in zip(dblock.nls, dblock.data):
                 key2 = (dblock.n_u, nl)
@@ -100,9 +263,22 @@ class PhysicalState:
         transition: tuple[int, int],
         stats: Optional[dict] = None,
     ) -> float:
-        
+        """
+        Returns the value of a single transition at a single (temp, dens). In
+        lazy mode, only the relevant block is decoded.
+        """
+        if (stats is None) and self.is_lazy:
+            from numpy import flatnonzero
+
+            idx: int = self.index.locate(self.data_type, transition[0], *td)
+            dblock: DataBlock = self.getBlock(idx)
+            if (pos := flatnonzero(dblock.nls == transition[1])).size == 0:
+                raise KeyError(transition)
+
+            return dblock.data[pos[0]]
+
         if stats is None:
-            if not hasattr(self, '_stats'):
+            if self._stats is None:
                 _ = self.getStats()
             stats = self._stats
 
@@ -114,10 +290,11 @@ class PhysicalState:
         """
         from collections import defaultdict
 
-        assert self.data_blocks is not None
-
         d = defaultdict(lambda: [])
-        for dblock in self.data_blocks:
+        if self.store is not None:
+            return self.store.appendToDict(d)
+
+        for dblock in self.iterBlocks():
             _ = dblock.appendToDict(d)
 
         return d
@@ -128,6 +305,4 @@ class PhysicalState:
         """
         from pandas import DataFrame
 
-        assert self.data_blocks is not None
-
         return DataFrame(self.toDict())
\ No newline at end of file
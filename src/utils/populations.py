@@ -0,0 +1,158 @@
+"""
+Submodule containing utilities for computing level populations.
+
+LTE populations follow from the Saha-Boltzmann equation for a hydrogenic ion
+of charge z, with statistical weights g_n = 2 n^2 and g_ion = 1:
+
+    N_n^LTE = N_e N_ion n^2 (h^2 / 2 pi m_e k T)^(3/2) exp(z^2 I_H / n^2 k T)
+
+and actual populations are N_n = b_n N_n^LTE, with the departure coefficients
+b_n interpolated from the 'dep' table. Everything is vectorised over points and
+levels.
+
+The 'dep' table holds the l-resolved coefficients b(n, l): each 'B_NU=n' block
+of a data file lists l = 0..n-1, stored as (n_u, n_l) = (n, l). The l-summed
+'BNS' lines are not parsed, so b_n is recovered by weighting the sublevels by
+their statistical weights, 2l+1 out of n^2:
+
+    b_n = sum_l (2l + 1) b(n, l) / n^2
+"""
+from typing import Optional, Union, Iterable
+import numpy as np
+
+from ..custom_types import RecType
+from .grid import Grid
+
+# (h^2 / 2 pi m_e k)^(3/2) in cm^3 K^(3/2)
+SAHA_CONSTANT: float = 4.14133e-16
+# Ionisation potential of hydrogen over Boltzmann's constant, in K
+T_H: float = 157802.8
+
+ArrayLike = Union[float, Iterable[float], np.ndarray]
+
+def lte_populations(
+    temp: ArrayLike,
+    dens: ArrayLike,
+    levels: Iterable[int],
+    z: int = 1,
+    ion_dens: Optional[ArrayLike] = None,
+    log: bool = False,
+) -> np.ndarray[float]:
+    """
+    Returns the LTE populations (cm^-3) of the levels at every (temp, dens)
+    point, with shape (n_points, n_levels). The ion density defaults to the
+    electron density.
+
+    If 'log' is True, log10 of the populations is returned instead, which
+    avoids overflow at low temperatures and high z.
+    """
+    from numpy import asarray, atleast_1d, broadcast_arrays, log10, e
+
+    temp, dens = broadcast_arrays(
+        atleast_1d(asarray(temp, dtype=float)).ravel(),
+        atleast_1d(asarray(dens, dtype=float)).ravel(),
+    )
+    if ion_dens is None: ion_dens = dens
+    else: ion_dens = broadcast_arrays(
+        atleast_1d(asarray(ion_dens, dtype=float)).ravel(), temp,
+    )[0]
+
+    n = asarray(levels, dtype=float).ravel()[None, :]
+    temp = temp[:, None]
+
+    log_pops = (log10(dens) + log10(ion_dens) + log10(SAHA_CONSTANT))[:, None] \
+        - 1.5 * log10(temp) \
+        + 2 * log10(n) \
+        + (z**2 * T_H / (n**2 * temp)) * log10(e)
+
+    return log_pops if log else 10**log_pops
+
+def sublevel_departure_coefficients(
+    grid: Grid,
+    temp: ArrayLike,
+    dens: ArrayLike,
+    sublevels: Iterable[tuple[int, int]],
+) -> np.ndarray[float]:
+    """
+    Interpolates the departure coefficients b(n, l) of the (n, l) sublevels
+    from a 'dep' grid, returning an array with shape (n_points, n_sublevels).
+    """
+    return grid.select(sublevels).interpolate(temp, dens, log_values=False)
+
+def departure_coefficients(
+    grid: Grid,
+    temp: ArrayLike,
+    dens: ArrayLike,
+    levels: Iterable[int],
+) -> np.ndarray[float]:
+    """
+    Interpolates the departure coefficients b_n of the levels from a 'dep' grid
+    of b(n, l), returning an array with shape (n_points, n_levels).
+
+    Levels missing from the grid are NaN. Raises a ValueError if the grid is not
+    l-resolved, or if it holds only some of the sublevels of a level.
+    """
+    from numpy import asarray, nan
+
+    levels = asarray(levels, dtype=int).ravel()
+    assert (levels >= 1).all()
+
+    n, l = grid.transitions[:, 0], grid.transitions[:, 1]
+    if ((l < 0) | (l >= n)).any():
+        raise ValueError("The 'dep' grid does not hold b(n, l) with l < n")
+
+    # Statistical weights, mapping the sublevels onto the requested levels
+    match = n[:, None] == levels[None, :]
+    counts = match.sum(axis=0)
+    if (incomplete := levels[(counts > 0) & (counts != levels)]).size > 0:
+        raise ValueError(
+            f"The 'dep' grid lacks sublevels of n = {incomplete.tolist()}"
+        )
+
+    weights = match * (2 * l[:, None] + 1) / levels[None, :]**2.
+
+    values = grid.interpolate(temp, dens, log_values=False)
+    out = np.where(np.isnan(values), 0., values) @ weights
+
+    # Missing data, for either the level or the point
+    missing = (np.isnan(values).astype(float) @ match) > 0
+    out[missing] = nan
+    out[:, counts == 0] = nan
+
+    return out
+
+def level_populations(
+    temp: ArrayLike,
+    dens: ArrayLike,
+    levels: Iterable[int],
+    z: int = 1,
+    rec_case: RecType = 'B',
+    grid: Optional[Grid] = None,
+    name: Optional[str] = None,
+    ion_dens: Optional[ArrayLike] = None,
+    log: bool = False,
+) -> np.ndarray[float]:
+    """
+    Returns the populations (cm^-3) of the levels at every (temp, dens) point,
+    i.e. the LTE populations corrected by the interpolated departure
+    coefficients, with shape (n_points, n_levels).
+
+    The 'dep' grid is read from the database unless given. Points off the grid
+    are NaN. If 'log' is True, log10 of the populations is returned.
+    """
+    from numpy import log10
+
+    if grid is None:
+        grid = Grid.from_query('dep', z, rec_case, name=name)
+
+    log_lte = lte_populations(
+        temp, dens, levels,
+        z = z,
+        ion_dens = ion_dens,
+        log = True,
+    )
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_pops = log_lte + log10(departure_coefficients(grid, temp, dens, levels))
+
+    return log_pops if log else 10**log_pops
@@ -1,7 +1,7 @@
 """
 Submodule containing utilities for retrieving data from databases.
 """
-from typing import Optional, Union, Iterable
+from typing import Optional, Union, Iterable, Iterator
 
 class Query:
     """
@@ -21,6 +21,33 @@ class Query:
                 .ORDER_BY('wave', descending=False)
                 .LIMIT(100)
                 .STOP()
+
+    Databases built with aggregates (see 'init_db.py --aggregates') contain 
+    summary tables, read like any other table, e.g. q.FROM('emi_series'):
+    - '<emi|rec>_series':       sums over n_u per (rec_case, z, n_l, temp, dens).
+    - '<emi|rec>_lower_totals': sums over n_l per (rec_case, z, n_u, temp, dens).
+    - '<emi|rec>_totals':       sums over all lines per (rec_case, z, temp, dens).
+    - '<emi|rec>_ratios':       values relative to H-beta, i.e. (n_u, n_l) = 
+                                (4, 2).
+
+    Large results can be retrieved in chunks, at constant memory, with 
+    STREAM instead of STOP:
+
+    with Query.START(name_of_database) as q:
+        for chunk in q.FROM(name_of_table).SELECT('*').STREAM(65536):
+            ...
+
+    Several databases (e.g. built per Z range) can be queried as one by passing
+    a list of names to START. They are attached to a single connection and 
+    their tables are combined with UNION ALL, while ORDER_BY and LIMIT apply to
+    the combined result:
+
+    with Query.START(['db_z1', 'db_z2_4']) as q:
+        ...
+
+    Rows of ions removed by 'scaling.compact_database' are served scaled from 
+    the reference ion's rows, as recorded in the database's 'scaling' table, so
+    compacted databases are queried like any other.
     """
     def __init__(self):
         from sqlite3 import Connection, Cursor
@@ -28,9 +55,15 @@ class Query:
         self.connection: Optional[Connection] = None
         self.cursor: Optional[Cursor] = None
 
+        # Schemas of all queried databases, if more than one
+        self.schemas: list[str] = []
+
         self.table: Optional[str] = None
         self.columns: list[str] = []
 
+        # Accepted scalings of the table, per schema (None if not federated)
+        self.scalings: dict[Optional[str], list[tuple]] = {}
+
         self.where_logic: list[str] = []
         self.order_by_logic: list[tuple[str, str]] = []
         self.limit: Optional[int] = None
@@ -55,9 +88,12 @@ class Query:
         query_elems.append("SELECT " + ", ".join(self.columns))
 
         assert self.table is not None
-        query_elems.append(f"FROM {self.table}")
+        if self.schemas:
+            query_elems.append(f"FROM ({self._build_union()})")
+        else:
+            query_elems.append(f"FROM {self._build_source()}")
 
-        if self.where_logic:
+        if self.where_logic and not self.schemas:
             # Apply WHERE
             query_elems.append(
                 "WHERE " + " AND ".join(self.where_logic)
@@ -78,7 +114,108 @@ class Query:
         query: str = ' '.join(query_elems) + ';'
 
         return query_elems, query
+
+    def _build_union(self) -> str:
+        """
+        Builds the UNION ALL of the table across all queried databases. Each
+        database is filtered (and, if ordered and limited, truncated) on its 
+        own before being combined.
+        """
+        columns: list[str] = list(self.columns)
+        columns.extend(
+            c for c, _ in self.order_by_logic if c not in columns
+        )
+
+        sub_elems: list[str] = []
+        if self.where_logic:
+            sub_elems.append("WHERE " + " AND ".join(self.where_logic))
+        if self.order_by_logic and self.limit:
+            f = lambda a: "{} {}".format(*a)
+            sub_elems.append(
+                "ORDER BY " + ", ".join(map(f, self.order_by_logic))
+            )
+            sub_elems.append(f"LIMIT {self.limit}")
+
+        return " UNION ALL ".join(
+            "SELECT * FROM (SELECT {} FROM {} {})".format(
+                ", ".join(columns), self._build_source(schema),
+                ' '.join(sub_elems),
+            ) \
+            for schema in self.schemas
+        )
     
+    def _build_source(
+        self,
+        schema: Optional[str] = None,
+    ) -> str:
+        """
+        Builds the source of the table (in 'schema'). If ions of the table were
+        compacted, it is the union of the stored rows of the other ions with
+        the compacted ions' rows, scaled from their reference.
+        """
+        from .scaling import scaled_columns
+
+        table: str = self.table if schema is None else f"{schema}.{self.table}"
+        if not (scalings := self.scalings.get(schema)):
+            return table
+
+        columns: list[str] = self.column_names
+        compacted: str = ", ".join(
+            f"({int(z)}, '{rec_case}')" for z, rec_case, _, _ in scalings
+        )
+
+        branches: list[str] = [
+            f"SELECT {', '.join(columns)} FROM {table} "
+            f"WHERE (z, rec_case) NOT IN (VALUES {compacted})"
+        ]
+        branches.extend(
+            f"SELECT {', '.join(scaled_columns(columns, z, z_ref, exponent))} "
+            f"FROM {table} WHERE z == {int(z_ref)} AND rec_case == '{rec_case}'" \
+            for z, rec_case, z_ref, exponent in scalings
+        )
+
+        return f"({' UNION ALL '.join(branches)})"
+
+    def _execute(
+        self,
+        query: str,
+    ) -> list[tuple]:
+        """
+        Runs a query on the connected database(s), returning all rows.
+        """
+        return self.cursor.execute(query).fetchall()
+
+    def _load_scalings(self) -> dict[Optional[str], list[tuple]]:
+        """
+        Reads the accepted scalings of the table (or of the table it aggregates)
+        from each queried database, as (z, rec_case, z_ref, exponent).
+        """
+        from .scaling import SCALING_TABLE, scaling_source
+
+        scalings: dict[Optional[str], list[tuple]] = {}
+        if (source := scaling_source(self.table)) is None:
+            return scalings
+        data_type, scales_values = source
+
+        for schema in (self.schemas or [None]):
+            prefix: str = '' if schema is None else f"{schema}."
+
+            if not self._execute(
+                f"SELECT 1 FROM {prefix}sqlite_master "
+                f"WHERE type='table' AND name='{SCALING_TABLE}'"
+            ):
+                continue
+
+            scalings[schema] = [
+                (z, rec_case, z_ref, exponent if scales_values else 0.) \
+                for z, rec_case, z_ref, exponent in self._execute(
+                    f"SELECT z, rec_case, z_ref, exponent FROM {prefix}{SCALING_TABLE} "
+                    f"WHERE data_type == '{data_type}' AND accepted == 1"
+                )
+            ]
+
+        return scalings
+
     @property
     def column_info(self):
         """
@@ -97,18 +234,23 @@ class Query:
         if getattr(self, '_table_names', None) is not None:
             return self._table_names
 
-        query_result: list[tuple] = self.cursor.execute(
-            "SELECT name FROM sqlite_master WHERE type='table';",
-        ).fetchall()
-
-        if not all([len(tnames) == 1 for tnames in query_result]):
-            raise ValueError(
-                "Connected database is not valid!"
-            )
+        table_names: Optional[list[str]] = None
+        for schema in (self.schemas or ['main']):
+            query_result: list[tuple] = self.cursor.execute(
+                f"SELECT name FROM {schema}.sqlite_master WHERE type='table';",
+            ).fetchall()
+
+            if not all([len(tnames) == 1 for tnames in query_result]):
+                raise ValueError(
+                    "Connected database is not valid!"
+                )
+
+            # Only tables found in every database can be queried
+            names: list[str] = [tnames[0] for tnames in query_result]
+            table_names = names if table_names is None \
+                else [tname for tname in table_names if tname in names]
         
-        self._table_names: list[str] = [
-            tnames[0] for tnames in query_result
-        ]
+        self._table_names: list[str] = table_names
         
         return self._table_names
     
@@ -129,19 +271,50 @@ class Query:
 
     def connectToDatabase(
         self, 
-        name: Optional[str] = None,
+        name: Optional[Union[str, Iterable[str]]] = None,
     ) -> 'Query':
         """
-        Connects this instance to the designated (or default) database. 
+        Connects this instance to the designated (or default) database. If
+        several names are given, the remaining databases are attached to the
+        first one's connection.
         """
-        from .writing import connect_to_db
-        _, self.connection = connect_to_db(name=name, replace=False)
+        from sqlite3 import SQLITE_LIMIT_ATTACHED
+        from .writing import connect_to_db, get_db_path
+
+        if (name is None) or isinstance(name, str):
+            _, self.connection = connect_to_db(name=name, replace=False)
+            self.cursor = self.connection.cursor()
+            return self
+
+        names: list[str] = list(name)
+        assert len(names) > 0
+
+        # Connecting would otherwise create missing databases
+        for other in names:
+            if not get_db_path(other).exists():
+                raise FileNotFoundError(f"Database '{other}' was not found")
+
+        _, self.connection = connect_to_db(name=names[0], replace=False)
         self.cursor = self.connection.cursor()
+        self.schemas = ['main']
+
+        max_attached: int = self.connection.getlimit(SQLITE_LIMIT_ATTACHED)
+        if len(names) - 1 > max_attached:
+            raise ValueError(
+                f"At most {max_attached + 1} databases can be queried together"
+            )
+
+        for idx, other in enumerate(names[1:], start=1):
+            self.cursor.execute(
+                f"ATTACH DATABASE ? AS db{idx}", (str(get_db_path(other)),),
+            )
+            self.schemas.append(f"db{idx}")
+
         return self
 
     @staticmethod
     def START(
-        name: Optional[str] = None,
+        name: Optional[Union[str, Iterable[str]]] = None,
     ) -> 'Query':
         """
         Creates a Query instance and connects it to a database.
@@ -159,6 +332,51 @@ class Query:
             self.connection,
         ).to_dict(orient='list')
     
+    def STREAM(
+        self,
+        chunk_size: int = 65536,
+    ) -> Iterator[dict]:
+        """
+        Builds the SQL query and yields the data in chunks of at most 
+        'chunk_size' rows, each a dictionary of column -> values (like STOP).
+        """
+        assert chunk_size >= 1
+
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(self._build_query()[1])
+            names: list[str] = [d[0] for d in cursor.description]
+
+            while rows := cursor.fetchmany(chunk_size):
+                yield dict(
+                    (name, [row[idx] for row in rows]) \
+                    for idx, name in enumerate(names)
+                )
+        finally:
+            cursor.close()
+
+    def AGGREGATE(
+        self,
+        *expression: str,
+    ) -> tuple:
+        """
+        Evaluates aggregate expressions (e.g. 'COUNT(*)' or 'MAX(LENGTH(z))')
+        over the result of the query, without retrieving it.
+        """
+        order_by_logic = self.order_by_logic
+        if not self.limit:
+            # The order does not affect aggregates of the whole result
+            self.order_by_logic = []
+
+        try:
+            subquery: str = self._build_query()[1].removesuffix(';')
+        finally:
+            self.order_by_logic = order_by_logic
+
+        return self.cursor.execute(
+            f"SELECT {', '.join(expression)} FROM ({subquery});"
+        ).fetchone()
+
     def FROM(
         self,
         table: str,
@@ -173,6 +391,7 @@ class Query:
             )
 
         self.table = table
+        self.scalings = self._load_scalings()
 
         return self
     
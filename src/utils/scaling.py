@@ -0,0 +1,274 @@
+"""
+Submodule containing utilities for serving other ions' data by hydrogenic
+scaling from a reference ion.
+
+For a hydrogenic ion of charge z, the data at (temp, dens) follow from those of
+a reference ion z_ref at (temp / s^2, dens / s^7), with s = z / z_ref, times
+s^p for a per-table exponent p (emi ~ z^3, rec ~ z, dep ~ 1).
+
+Each scaling is validated against the stored table of z, and only accepted if
+it reproduces every value to within a tolerance (in dex). Accepted scalings are
+recorded in the 'scaling' table, after which the stored rows of z can be
+removed: 'Query' (and hence 'Grid.from_query') then serves them scaled from the
+reference rows. The same goes for the table's aggregates (see
+'writing.create_aggregates'), whose sums scale like the table's values and
+whose ratios do not scale at all.
+"""
+from typing import Optional, Iterable
+from dataclasses import dataclass, asdict
+import numpy as np
+
+from ..custom_types import DataType, RecType
+from .grid import Grid, Transition
+
+SCALING_TABLE: str = 'scaling'
+
+# Exponent of z by which each table's values scale. None means the exponent is
+# fitted to the stored tables when validating.
+SCALING_EXPONENTS: dict[DataType, Optional[float]] = {
+    'emi': 3.,
+    'rec': 1.,
+    'opa': None,
+    'dep': 0.,
+}
+
+# Largest error (in dex) of an accepted scaling
+TOLERANCE: float = 0.01
+
+# Suffixes of the aggregate tables of a table, and whether their values scale
+# like the table's (sums do, ratios of two of its values do not)
+AGGREGATE_SUFFIXES: dict[str, bool] = {
+    'series': True,
+    'lower_totals': True,
+    'totals': True,
+    'ratios': False,
+}
+
+def scale_grid(
+    grid: Grid,
+    z: int,
+    exponent: float,
+) -> Grid:
+    """
+    Returns the grid of ion z obtained by hydrogenic scaling of 'grid'.
+    """
+    s: float = z / grid.z
+
+    return Grid(
+        grid.table, grid.rec_case, z,
+        temps = grid.temps * s**2,
+        denss = grid.denss * s**7,
+        transitions = grid.transitions,
+        values = grid.values * s**exponent,
+    )
+
+@dataclass(slots=True)
+class ScalingReport:
+    """
+    Accuracy of the scaling from z_ref to z of one table. Errors are in dex,
+    and 'coverage' is the fraction of stored values the scaling reproduces.
+    """
+    data_type: DataType
+    rec_case: RecType
+    z: int
+    z_ref: int
+    exponent: float
+    max_error: float
+    rms_error: float
+    coverage: float
+    accepted: bool
+
+    def toRecord(self) -> dict:
+        return asdict(self)
+
+def validate_scaling(
+    reference: Grid,
+    target: Grid,
+    exponent: Optional[float] = None,
+    tolerance: float = TOLERANCE,
+) -> ScalingReport:
+    """
+    Compares the scaling of 'reference' with the stored grid 'target', at
+    every point and transition of 'target'. If 'exponent' is None, it is fitted
+    by least squares.
+    """
+    from numpy import meshgrid, log10, isfinite, sqrt, nan
+
+    assert (reference.table, reference.rec_case) == (target.table, target.rec_case)
+    assert target.z != reference.z
+
+    ref_set = set(map(tuple, reference.transitions.tolist()))
+    common: list[Transition] = [
+        trans for trans in map(tuple, target.transitions.tolist()) \
+        if trans in ref_set
+    ]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stored = log10(target.values)
+    n_stored: int = int(isfinite(stored).sum())
+
+    log_s: float = log10(target.z / reference.z)
+    resid = np.empty((0,))
+
+    if len(common) > 0:
+        tt, dd = meshgrid(target.temps, target.denss, indexing='ij')
+        predicted = scale_grid(reference.select(common), target.z, 0.) \
+            .interpolate(tt.ravel(), dd.ravel())
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            resid = stored[..., target.indicesOf(common)].reshape(tt.size, -1) \
+                - log10(predicted)
+        resid = resid[isfinite(resid)]
+
+    if exponent is None:
+        exponent = resid.mean() / log_s if resid.size > 0 else nan
+
+    if resid.size > 0:
+        err = resid - exponent * log_s
+        max_error, rms_error = np.abs(err).max(), sqrt((err**2).mean())
+    else:
+        max_error = rms_error = nan
+
+    coverage: float = resid.size / n_stored if n_stored > 0 else 0.
+
+    return ScalingReport(
+        target.table, target.rec_case,
+        z = int(target.z),
+        z_ref = int(reference.z),
+        exponent = float(exponent),
+        max_error = float(max_error),
+        rms_error = float(rms_error),
+        coverage = float(coverage),
+        accepted = bool((coverage == 1.) and (max_error <= tolerance)),
+    )
+
+def scaling_source(
+    table: str,
+) -> Optional[tuple[DataType, bool]]:
+    """
+    Returns the data type whose scalings apply to a table (the table itself or
+    one of its aggregates), and whether the table's values scale with it. None
+    if scalings do not apply.
+    """
+    if table in SCALING_EXPONENTS:
+        return table, True
+
+    data_type, _, suffix = table.partition('_')
+    if (data_type in SCALING_EXPONENTS) and (suffix in AGGREGATE_SUFFIXES):
+        return data_type, AGGREGATE_SUFFIXES[suffix]
+
+    return None
+
+def scaled_columns(
+    columns: Iterable[str],
+    z: int,
+    z_ref: int,
+    exponent: float,
+) -> list[str]:
+    """
+    Returns SQL expressions deriving the columns of ion z's rows from those of
+    the reference ion z_ref (see 'scale_grid'). Wavelengths scale as z^-2.
+    """
+    s: float = z / z_ref
+    factors: dict[str, float] = {
+        'wave': s**-2,
+        'temp': s**2,
+        'dens': s**7,
+        'val':  s**exponent,
+    }
+
+    return [
+        f"{int(z)} AS z" if column == 'z' \
+        else f"{column} * {factors[column]!r} AS {column}" if column in factors \
+        else column \
+        for column in columns
+    ]
+
+def compact_database(
+    name: Optional[str] = None,
+    tables: Optional[Iterable[DataType]] = None,
+    z_ref: int = 1,
+    tolerance: float = TOLERANCE,
+    dry_run: bool = False,
+) -> list[ScalingReport]:
+    """
+    Validates the scaling of every stored z from z_ref, for each table and
+    recombination case, and records the reports in the 'scaling' table.
+
+    Unless 'dry_run' is True, the stored rows of every accepted (table, z,
+    rec_case) are then removed from the base table and its aggregate tables,
+    and the database is vacuumed. Rejected ones are kept, and served as before.
+    """
+    from pandas import DataFrame
+    from .writing import connect_to_db
+
+    if tables is None: tables = list(SCALING_EXPONENTS.keys())
+
+    _, connection = connect_to_db(name=name, replace=False)
+    try:
+        table_names: list[str] = [
+            row[0] for row in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type='table'"
+            )
+        ]
+
+        reports: list[ScalingReport] = []
+
+        for table in tables:
+            if table not in table_names: continue
+
+            pairs: set[tuple[int, RecType]] = set(connection.execute(
+                f"SELECT DISTINCT z, rec_case FROM {table}"
+            ).fetchall())
+
+            for rec_case in sorted(set(case for _, case in pairs)):
+                if (z_ref, rec_case) not in pairs: continue
+
+                reference = Grid.from_query(table, z_ref, rec_case, name=name)
+
+                for z in sorted(z for z, case in pairs if case == rec_case):
+                    if z == z_ref: continue
+
+                    reports.append(validate_scaling(
+                        reference,
+                        Grid.from_query(table, z, rec_case, name=name),
+                        exponent = SCALING_EXPONENTS.get(table),
+                        tolerance = tolerance,
+                    ))
+
+        if dry_run or len(reports) == 0:
+            return reports
+
+        if SCALING_TABLE in table_names:
+            for report in reports:
+                connection.execute(
+                    f"DELETE FROM {SCALING_TABLE} "
+                    "WHERE data_type == ? AND z == ? AND rec_case == ?",
+                    (report.data_type, report.z, report.rec_case),
+                )
+
+        DataFrame([report.toRecord() for report in reports]).to_sql(
+            SCALING_TABLE,
+            connection,
+            if_exists = 'append',
+            index = False,
+        )
+
+        for report in reports:
+            if not report.accepted: continue
+
+            for table in [report.data_type] + [
+                f"{report.data_type}_{suffix}" for suffix in AGGREGATE_SUFFIXES
+            ]:
+                if table not in table_names: continue
+                connection.execute(
+                    f"DELETE FROM {table} WHERE z == ? AND rec_case == ?",
+                    (report.z, report.rec_case),
+                )
+
+        connection.commit()
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+
+    return reports
@@ -0,0 +1,582 @@
+"""
+Submodule containing utilities for serving a database from a single, long-
+running process.
+
+The server copies a database into memory once, and answers batched requests
+over a Unix domain socket. Many small jobs on the same node can then share one
+warm copy of the data, instead of each opening (and loading) the database.
+
+Messages are JSON documents preceded by their length (4 bytes, big-endian). A
+request holds a list of operations, and the response holds one result per
+operation:
+
+    {"ops": [{"op": "sql", "query": "SELECT ..."}, ...]}
+    {"results": [{"val": [...], ...}, ...]}
+
+Supported operations:
+- 'sql':         runs a (read-only) query, see 'RemoteQuery'.
+- 'interpolate': interpolates a table on the (temp, dens) grid, see 'Grid'.
+- 'tables':      lists the database's tables.
+- 'columns':     lists a table's columns.
+- 'column_info': returns a table's 'PRAGMA table_info' rows.
+- 'open':        starts a (read-only) query, returning a cursor id.
+- 'fetch':       returns the next rows of an open cursor, closing it once
+                 exhausted.
+- 'close':       closes an open cursor.
+
+Cursors belong to the connection that opened them, and are closed when it ends.
+"""
+from typing import Optional, Any, Iterable, Iterator, Union
+from pathlib import Path
+from socketserver import ThreadingUnixStreamServer, StreamRequestHandler
+import numpy as np
+
+from ..custom_types import DataType, RecType
+from .reading import Query
+from .writing import db_dir
+
+HEADER_SIZE: int = 4
+
+def get_socket_path(name: Optional[str] = None) -> Path:
+    """
+    Returns the default socket location of a database's server.
+    """
+    if name is None: name = 'db'
+    else:            name = name.removesuffix('.db')
+
+    return db_dir / f"{name}.sock"
+
+def send_message(sock, message: dict) -> None:
+    """
+    Sends a length-prefixed JSON message.
+    """
+    from json import dumps
+
+    payload: bytes = dumps(message).encode('utf-8')
+    sock.sendall(len(payload).to_bytes(HEADER_SIZE, 'big') + payload)
+
+def recv_message(sock) -> Optional[dict]:
+    """
+    Receives a length-prefixed JSON message. Returns None if the connection
+    was closed.
+    """
+    from json import loads
+
+    def recv_exactly(n: int) -> Optional[bytes]:
+        buffer = bytearray()
+        while len(buffer) < n:
+            if not (chunk := sock.recv(n - len(buffer))):
+                return None
+            buffer += chunk
+        return bytes(buffer)
+
+    if (header := recv_exactly(HEADER_SIZE)) is None:
+        return None
+    if (payload := recv_exactly(int.from_bytes(header, 'big'))) is None:
+        return None
+
+    return loads(payload)
+
+class GridServer(ThreadingUnixStreamServer):
+    """
+    Serves a database, held in memory, over a Unix domain socket.
+
+    Identical operations arriving concurrently (from any client) are computed
+    once and their result is shared. Interpolations of the same grid within a
+    request are evaluated in a single call.
+    """
+    daemon_threads = True
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        socket_path: Optional[Path] = None,
+    ):
+        from sqlite3 import connect
+        from threading import Lock
+        from itertools import count
+
+        from .writing import connect_to_db, get_db_path
+
+        if not get_db_path(name).exists():
+            # Connecting would otherwise create an empty database
+            raise FileNotFoundError(f"Database '{name}' was not found")
+
+        if socket_path is None: socket_path = get_socket_path(name)
+        self.socket_path: Path = Path(socket_path)
+
+        # Copy the database into memory
+        _, source = connect_to_db(name=name, replace=False)
+        self.connection = connect(':memory:', check_same_thread=False)
+        source.backup(self.connection)
+        source.close()
+        self.connection.execute("PRAGMA query_only = ON")
+
+        self._db_lock = Lock()
+        self._inflight_lock = Lock()
+        self._inflight: dict[str, Any] = {}
+        self._grids: dict[tuple, Any] = {}
+        self._cursor_ids = count()
+
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+        super().__init__(str(self.socket_path), GridRequestHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.connection.close()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+    def execute(self, query: str) -> dict[str, list]:
+        """
+        Runs a read-only query, returning a dictionary of column -> values.
+        """
+        cursor = self.open(query)
+        try:
+            return self.fetch(cursor)
+        finally:
+            cursor.close()
+
+    def open(self, query: str):
+        """
+        Starts a read-only query, returning its cursor.
+        """
+        if not query.lstrip().upper().startswith('SELECT'):
+            raise ValueError("Only SELECT queries are served")
+
+        with self._db_lock:
+            return self.connection.execute(query)
+
+    def fetch(
+        self,
+        cursor,
+        size: Optional[int] = None,
+    ) -> dict[str, list]:
+        """
+        Returns the next 'size' rows (all by default) of a cursor, as a
+        dictionary of column -> values.
+        """
+        with self._db_lock:
+            rows: list[tuple] = cursor.fetchall() if size is None \
+                else cursor.fetchmany(size)
+            names: list[str] = [d[0] for d in cursor.description]
+
+        return dict(
+            (name, [row[idx] for row in rows]) \
+            for idx, name in enumerate(names)
+        )
+
+    def getGrid(
+        self,
+        table: DataType,
+        z: int,
+        rec_case: RecType,
+    ):
+        """
+        Returns the (cached) grid of a table for a single (z, rec_case). Each
+        grid is built once, however many requests need it concurrently.
+        """
+        from json import dumps
+
+        key = (table, int(z), rec_case)
+        if (grid := self._grids.get(key)) is None:
+            grid = self._coalesced(dumps(['grid', *key]), self._buildGrid, key)
+
+        return grid
+
+    def _buildGrid(self, key: tuple):
+        """
+        Reads a grid as 'Grid.from_query' does, so that compacted ions are
+        scaled from their reference, and caches it.
+        """
+        from .grid import Grid
+
+        # Built by another request since 'getGrid' looked
+        if (grid := self._grids.get(key)) is not None:
+            return grid
+
+        q = RemoteQuery()
+        q.client = LocalClient(self)
+        self._grids[key] = Grid.from_open_query(q, *key)
+
+        return self._grids[key]
+
+    def _coalesced(self, key: str, func, *args) -> Any:
+        """
+        Calls 'func(*args)', unless an identical call is already in flight, in
+        which case its result is awaited and shared.
+        """
+        from concurrent.futures import Future
+
+        with self._inflight_lock:
+            future: Optional[Future] = self._inflight.get(key)
+            owner: bool = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+
+        if not owner:
+            return future.result()
+
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+        return future.result()
+
+    def _interpolate(self, ops: list[dict]) -> list[dict]:
+        """
+        Evaluates interpolations of the same grid in a single call.
+        """
+        from numpy import concatenate, cumsum, asarray
+
+        first: dict = ops[0]
+        grid = self.getGrid(first['table'], first['z'], first['rec_case'])
+        if first.get('transitions') is not None:
+            grid = grid.select(first['transitions'])
+
+        temps = [asarray(op['temp'], dtype=float).ravel() for op in ops]
+        denss = [asarray(op['dens'], dtype=float).ravel() for op in ops]
+        temps, denss = zip(*(np.broadcast_arrays(t, d) for t, d in zip(temps, denss)))
+
+        values = grid.interpolate(
+            concatenate(temps),
+            concatenate(denss),
+            log_values = first.get('log_values', True),
+        )
+        bounds = cumsum([0] + [t.size for t in temps])
+
+        return [
+            {
+                'transitions': grid.transitions.tolist(),
+                'values': values[start:stop].tolist(),
+            } \
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+
+    def handle_ops(
+        self,
+        ops: list[dict],
+        cursors: Optional[dict[int, Any]] = None,
+    ) -> list[dict]:
+        """
+        Answers a batch of operations. Cursors opened by the batch are kept in
+        'cursors', which belongs to the client's connection.
+        """
+        from json import dumps
+        from collections import defaultdict
+
+        if cursors is None: cursors = {}
+
+        results: list = [None] * len(ops)
+
+        # Group interpolations by grid
+        interp_groups: dict[str, list[int]] = defaultdict(lambda: [])
+
+        for idx, op in enumerate(ops):
+            match op['op']:
+                case 'sql':
+                    results[idx] = self._coalesced(
+                        dumps(op), self.execute, op['query'],
+                    )
+                case 'tables':
+                    results[idx] = self.execute(
+                        "SELECT name FROM sqlite_master WHERE type='table'"
+                    )['name']
+                case 'columns':
+                    results[idx] = self.execute(
+                        f"SELECT name FROM pragma_table_info('{op['table']}')"
+                    )['name']
+                case 'column_info':
+                    info: dict = self.execute(
+                        f"SELECT * FROM pragma_table_info('{op['table']}')"
+                    )
+                    results[idx] = [list(row) for row in zip(*info.values())]
+                case 'open':
+                    cursor_id: int = next(self._cursor_ids)
+                    cursors[cursor_id] = self.open(op['query'])
+                    results[idx] = cursor_id
+                case 'fetch':
+                    if (cursor := cursors.get(op['cursor'])) is None:
+                        raise ValueError(f"No open cursor {op['cursor']}")
+                    results[idx] = self.fetch(cursor, op['size'])
+                    if len(next(iter(results[idx].values()), [])) < op['size']:
+                        cursors.pop(op['cursor']).close()
+                case 'close':
+                    if (cursor := cursors.pop(op['cursor'], None)) is not None:
+                        cursor.close()
+                case 'interpolate':
+                    key = dumps([
+                        op['table'], op['z'], op['rec_case'],
+                        op.get('transitions'), op.get('log_values', True),
+                    ])
+                    interp_groups[key].append(idx)
+                case _:
+                    raise ValueError(f"Unknown operation '{op['op']}'")
+
+        for key, idxs in interp_groups.items():
+            group: list[dict] = [ops[idx] for idx in idxs]
+            group_results = self._coalesced(
+                dumps(group), self._interpolate, group,
+            )
+            for idx, result in zip(idxs, group_results):
+                results[idx] = result
+
+        return results
+
+class GridRequestHandler(StreamRequestHandler):
+
+    def setup(self) -> None:
+        super().setup()
+        self.cursors: dict[int, Any] = {}
+
+    def handle(self) -> None:
+        while (message := recv_message(self.connection)) is not None:
+            try:
+                response = {'results': self.server.handle_ops(
+                    message['ops'], cursors=self.cursors,
+                )}
+            except Exception as e:
+                response = {'error': f"{type(e).__name__}: {e}"}
+
+            send_message(self.connection, response)
+
+    def finish(self) -> None:
+        for cursor in self.cursors.values():
+            cursor.close()
+        self.cursors.clear()
+        super().finish()
+
+class LocalClient:
+    """
+    Client answering requests within the server's own process, e.g. for a
+    'RemoteQuery' run by the server itself.
+    """
+    def __init__(self, server: GridServer):
+        self.server: GridServer = server
+
+    def close(self) -> None:
+        pass
+
+    def request(self, ops: list[dict]) -> list:
+        return self.server.handle_ops(ops)
+
+class RemoteClient:
+    """
+    Connection to a running 'GridServer'.
+    """
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        socket_path: Optional[Path] = None,
+    ):
+        from socket import socket, AF_UNIX, SOCK_STREAM
+
+        if socket_path is None: socket_path = get_socket_path(name)
+
+        self.sock = socket(AF_UNIX, SOCK_STREAM)
+        self.sock.connect(str(socket_path))
+
+    def __enter__(self) -> 'RemoteClient':
+        return self
+
+    def __exit__(self, type, value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def request(self, ops: list[dict]) -> list:
+        """
+        Sends a batch of operations, returning one result per operation.
+        """
+        send_message(self.sock, {'ops': ops})
+        response: Optional[dict] = recv_message(self.sock)
+
+        if response is None:
+            raise ConnectionError("Server closed the connection")
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+
+        return response['results']
+
+    def interpolate(
+        self,
+        table: DataType,
+        z: int,
+        rec_case: RecType,
+        temp: Union[float, Iterable[float]],
+        dens: Union[float, Iterable[float]],
+        transitions: Optional[Iterable[tuple[int, int]]] = None,
+        log_values: bool = True,
+    ) -> tuple[np.ndarray[int], np.ndarray[float]]:
+        """
+        Interpolates a table at the (temp, dens) points, see 'Grid.interpolate'.
+        Returns the transitions and the values.
+        """
+        from numpy import asarray
+
+        (result,) = self.request([{
+            'op': 'interpolate',
+            'table': table,
+            'z': int(z),
+            'rec_case': rec_case,
+            'temp': asarray(temp, dtype=float).ravel().tolist(),
+            'dens': asarray(dens, dtype=float).ravel().tolist(),
+            'transitions': None if transitions is None \
+                else [[int(n_u), int(n_l)] for n_u, n_l in transitions],
+            'log_values': log_values,
+        }])
+
+        return (
+            asarray(result['transitions'], dtype=int),
+            asarray(result['values'], dtype=float),
+        )
+
+class RemoteQuery(Query):
+    """
+    Query builder backed by a running 'GridServer' rather than a database file.
+    Supports the same clauses as 'Query'. A server holds a single database, so
+    several databases cannot be queried as one remotely (use 'Query' instead).
+
+    Basic usage:
+
+    with RemoteQuery.START(name_of_database) as q:
+        data = q.FROM(name_of_table)
+                .SELECT('z', 'n_u', 'n_l', 'val')
+                .WHERE('z', 'z == 1')
+                .LIMIT(100)
+                .STOP()
+    """
+    def __init__(self):
+        super().__init__()
+        self.client: Optional[RemoteClient] = None
+
+    def __exit__(self, type, value, traceback) -> None:
+        self.client.close()
+        self.client = None
+
+    @property
+    def column_info(self) -> list[tuple]:
+        assert self.client is not None
+        assert getattr(self, 'table') is not None
+
+        (info,) = self.client.request(
+            [{'op': 'column_info', 'table': self.table}]
+        )
+        return [tuple(row) for row in info]
+
+    @property
+    def table_names(self) -> list[str]:
+        assert self.client is not None
+
+        if getattr(self, '_table_names', None) is None:
+            (self._table_names,) = self.client.request([{'op': 'tables'}])
+
+        return self._table_names
+
+    @property
+    def column_names(self) -> list[str]:
+        assert self.client is not None
+        assert getattr(self, 'table') is not None
+
+        if getattr(self, '_column_names', None) is None:
+            (self._column_names,) = self.client.request(
+                [{'op': 'columns', 'table': self.table}]
+            )
+
+        return self._column_names
+
+    def _execute(
+        self,
+        query: str,
+    ) -> list[tuple]:
+        """
+        Runs a query on the server, returning all rows.
+        """
+        (result,) = self.client.request([{'op': 'sql', 'query': query}])
+        return list(zip(*result.values()))
+
+    def connectToDatabase(
+        self,
+        name: Optional[str] = None,
+        socket_path: Optional[Path] = None,
+    ) -> 'RemoteQuery':
+        """
+        Connects this instance to the server of the designated (or default)
+        database.
+        """
+        self.client = RemoteClient(name=name, socket_path=socket_path)
+        return self
+
+    @staticmethod
+    def START(
+        name: Optional[str] = None,
+        socket_path: Optional[Path] = None,
+    ) -> 'RemoteQuery':
+        """
+        Creates a RemoteQuery instance and connects it to a server.
+        """
+        if (name is not None) and not isinstance(name, str):
+            raise TypeError(
+                "A server holds a single database; use 'Query.START' to query "
+                "several databases as one"
+            )
+
+        q = RemoteQuery()
+        return q.connectToDatabase(name=name, socket_path=socket_path)
+
+    def STREAM(
+        self,
+        chunk_size: int = 65536,
+    ) -> Iterator[dict]:
+        """
+        Builds the SQL query and yields the data in chunks of at most 
+        'chunk_size' rows, fetched from a cursor held by the server.
+        """
+        assert chunk_size >= 1
+
+        (cursor_id,) = self.client.request(
+            [{'op': 'open', 'query': self._build_query()[1]}]
+        )
+        exhausted: bool = False
+        try:
+            while not exhausted:
+                (chunk,) = self.client.request([
+                    {'op': 'fetch', 'cursor': cursor_id, 'size': chunk_size}
+                ])
+                n_rows: int = len(next(iter(chunk.values()), []))
+
+                # The server closes the cursor once it is exhausted
+                exhausted = n_rows < chunk_size
+                if n_rows > 0:
+                    yield chunk
+        finally:
+            if not exhausted:
+                self.client.request([{'op': 'close', 'cursor': cursor_id}])
+
+    def AGGREGATE(self, *expression: str) -> tuple:
+        """
+        Evaluates aggregate expressions over the result of the query, on the
+        server.
+        """
+        subquery: str = self._build_query()[1].removesuffix(';')
+        (result,) = self.client.request([{
+            'op': 'sql',
+            'query': f"SELECT {', '.join(expression)} FROM ({subquery})",
+        }])
+        return tuple(values[0] for values in result.values())
+
+    def STOP(self) -> dict:
+        """
+        Builds the SQL query and retrieves the data from the server.
+        """
+        (result,) = self.client.request(
+            [{'op': 'sql', 'query': self._build_query()[1]}]
+        )
+        return result
@@ -0,0 +1,198 @@
+"""
+Submodule containing utilities for synthesising spectra from line fluxes.
+
+Lines are binned onto a grid that is uniform in log-wavelength, so that a
+velocity kernel has the same width (in pixels) everywhere. Broadening is then a
+single convolution, done with FFTs, rather than one profile per line and pixel.
+"""
+from typing import Optional, Union
+import numpy as np
+
+# Speed of light in km/s
+C_KMS: float = 299792.458
+# Kernels are truncated (and spectra padded) at this many standard deviations
+N_SIGMA: float = 8.
+
+def log_wave_grid(
+    wave_min: float,
+    wave_max: float,
+    velocity_step: float,
+) -> np.ndarray[float]:
+    """
+    Returns the pixel centres of a grid spanning [wave_min, wave_max] that is
+    uniform in ln(wave), with a step of 'velocity_step' km/s.
+    """
+    from numpy import log, arange, exp
+
+    step: float = velocity_step / C_KMS
+    n_pix: int = int(np.floor(log(wave_max / wave_min) / step)) + 1
+
+    return wave_min * exp(step * arange(n_pix))
+
+def bin_lines(
+    waves: np.ndarray[float],
+    fluxes: np.ndarray[float],
+    grid: np.ndarray[float],
+) -> np.ndarray[float]:
+    """
+    Distributes line fluxes onto a log-wavelength grid, splitting each line
+    linearly between its two neighbouring pixels (conserving flux). Lines off
+    the grid are dropped.
+
+    'fluxes' may hold several templates, with shape (..., n_lines), in which
+    case the output has shape (..., n_pix).
+    """
+    from numpy import log, floor, bincount, asarray
+
+    waves = asarray(waves, dtype=float)
+    fluxes = asarray(fluxes, dtype=float)
+    assert fluxes.shape[-1] == waves.size
+
+    n_pix: int = grid.size
+    step: float = log(grid[1] / grid[0])
+
+    pos = log(waves / grid[0]) / step
+    on_grid = (pos >= 0) & (pos <= n_pix - 1)
+    pos, fluxes = pos[on_grid], fluxes[..., on_grid]
+
+    lower = np.minimum(floor(pos).astype(int), n_pix - 2)
+    frac = pos - lower
+
+    batch_shape: tuple = fluxes.shape[:-1]
+    fluxes = fluxes.reshape(-1, pos.size)
+
+    # Flattened (template, pixel) indices allow a single bincount
+    offsets = (np.arange(fluxes.shape[0]) * n_pix)[:, None]
+    size: int = fluxes.shape[0] * n_pix
+
+    binned = bincount(
+        (offsets + lower).ravel(), (fluxes * (1 - frac)).ravel(), size,
+    ) + bincount(
+        (offsets + lower + 1).ravel(), (fluxes * frac).ravel(), size,
+    )
+
+    return binned.reshape(*batch_shape, n_pix)
+
+def fft_size(n: int) -> int:
+    """
+    Returns the smallest 5-smooth number (fast FFT length) of at least n.
+    """
+    best: int = 1 << int(np.ceil(np.log2(max(n, 1))))
+
+    p5: int = 1
+    while p5 < best:
+        p35: int = p5
+        while p35 < best:
+            p235: int = p35
+            while p235 < n: p235 *= 2
+            best = min(best, p235)
+            p35 *= 3
+        p5 *= 5
+
+    return best
+
+def broaden(
+    spectra: np.ndarray[float],
+    velocity_step: float,
+    sigmas: Union[float, np.ndarray[float]],
+    sigma_instrumental: float = 0.,
+) -> np.ndarray[float]:
+    """
+    Convolves binned spectra with Gaussian velocity kernels, one per entry of
+    'sigmas' (km/s), optionally combined with a Gaussian instrumental kernel.
+
+    Gaussians are applied through their analytic Fourier transform, so all
+    kernels cost one forward and one inverse FFT per spectrum in total. The
+    output has shape (n_kernels, ..., n_pix).
+    """
+    from numpy import atleast_1d, asarray, sqrt, exp, pi
+    from numpy.fft import rfft, irfft, rfftfreq
+
+    spectra = asarray(spectra, dtype=float)
+    sigmas = atleast_1d(asarray(sigmas, dtype=float))
+
+    # Kernel widths in pixels
+    sigma_pix = sqrt(sigmas**2 + sigma_instrumental**2) / velocity_step
+
+    n_pix: int = spectra.shape[-1]
+    n_fft: int = fft_size(n_pix + int(np.ceil(N_SIGMA * sigma_pix.max())))
+
+    freqs = rfftfreq(n_fft)
+    transfer = exp(-2 * (pi * freqs)**2 * sigma_pix[:, None]**2)
+    transfer = transfer.reshape(sigmas.size, *(1,) * (spectra.ndim - 1), -1)
+
+    ft = rfft(spectra, n=n_fft, axis=-1)
+
+    return irfft(ft[None] * transfer, n=n_fft, axis=-1)[..., :n_pix]
+
+def convolve(
+    spectra: np.ndarray[float],
+    kernels: np.ndarray[float],
+) -> np.ndarray[float]:
+    """
+    Convolves binned spectra with arbitrary kernels sampled on the same (log-
+    wavelength) pixel grid, with shape (n_kernels, n_k) and centred on pixel
+    n_k // 2. The output has shape (n_kernels, ..., n_pix).
+    """
+    from numpy import asarray, atleast_2d
+    from numpy.fft import rfft, irfft
+
+    spectra = asarray(spectra, dtype=float)
+    kernels = atleast_2d(asarray(kernels, dtype=float))
+
+    n_pix: int = spectra.shape[-1]
+    n_k: int = kernels.shape[-1]
+    n_fft: int = fft_size(n_pix + n_k)
+
+    ft_spectra = rfft(spectra, n=n_fft, axis=-1)
+    ft_kernels = rfft(kernels, n=n_fft, axis=-1) \
+        .reshape(kernels.shape[0], *(1,) * (spectra.ndim - 1), -1)
+
+    out = irfft(ft_spectra[None] * ft_kernels, n=n_fft, axis=-1)
+
+    # Undo the kernel's centring offset
+    shift: int = n_k // 2
+    return out[..., shift:shift + n_pix]
+
+def synthesize(
+    waves: np.ndarray[float],
+    fluxes: np.ndarray[float],
+    wave_min: float,
+    wave_max: float,
+    sigmas: Union[float, np.ndarray[float]],
+    sigma_instrumental: float = 0.,
+    velocity_step: Optional[float] = None,
+) -> tuple[np.ndarray[float], np.ndarray[float]]:
+    """
+    Synthesises broadened spectra from line wavelengths (e.g. from
+    'calculateWave') and fluxes (e.g. emissivities).
+
+    Returns the wavelength grid and the spectra (flux per unit wavelength),
+    with shape (n_kernels, ..., n_pix). If 'velocity_step' is not given, the
+    narrowest kernel is sampled by 4 pixels per standard deviation.
+
+    Lines outside [wave_min, wave_max] are dropped, so the range should extend
+    a few kernel widths beyond the region of interest.
+
+    Flux is conserved exactly, but the linear split in 'bin_lines' widens each
+    line by a variance of up to 1/4 pixel**2. At 4 pixels per standard
+    deviation, profiles deviate from the exact Gaussian by at most ~0.8% of
+    their peak (1/(8 n**2) at n pixels per standard deviation); pass a smaller
+    'velocity_step' if that matters.
+    """
+    from numpy import atleast_1d, sqrt
+
+    if velocity_step is None:
+        narrowest = sqrt(atleast_1d(sigmas).min()**2 + sigma_instrumental**2)
+        assert narrowest > 0, "Specify 'velocity_step' for unbroadened spectra"
+        velocity_step = narrowest / 4
+
+    grid = log_wave_grid(wave_min, wave_max, velocity_step)
+
+    binned = bin_lines(waves, fluxes, grid)
+    spectra = broaden(binned, velocity_step, sigmas, sigma_instrumental)
+
+    # Pixel widths, for converting to flux per unit wavelength
+    widths = grid * velocity_step / C_KMS
+
+    return grid, spectra / widths
@@ -11,6 +11,13 @@ from ..custom_types import DataType, RecType
 this_file: Path = Path(__file__)
 db_dir: Path = this_file.parents[2] / 'databases'
 
+CHUNK_SIZE: int = 1 << 16
+
+# Data types for which aggregate tables can be materialised
+AGGREGATE_DATA_TYPES: tuple[DataType] = ('emi', 'rec')
+# Line to which ratios are normalised: (n_u, n_l) = (4, 2), i.e. H-beta
+REFERENCE_LINE: tuple[int, int] = (4, 2)
+
 def initialise_db(
     path: Path,
 ) -> Connection:
@@ -35,6 +42,17 @@ def initialise_db(
 
     return connection
 
+def get_db_path(
+    name: Optional[str] = None,
+) -> Path:
+    """
+    Returns the location of the designated (or default) database.
+    """
+    if name is None: name = 'db'
+    else:            name = name.removesuffix('.db')
+
+    return db_dir / f"{name}.db"
+
 def connect_to_db(
     name: Optional[str] = None,
     replace: bool = False,
@@ -47,14 +65,10 @@ def connect_to_db(
 
     If database exists and 'replace' is True, it is reset.
     """
-    from pathlib import Path
     from os import remove
     from sqlite3 import connect
 
-    if name is None: name = 'db'
-    else:            name = name.removesuffix('.db')
-
-    path_to_db: Path = db_dir / f"{name}.db"
+    path_to_db: Path = get_db_path(name)
     if path_to_db.exists() and replace:
         # Removes the database and re-initialises it
         remove(path_to_db)
@@ -125,6 +139,72 @@ def unzip_and_read(
     with gzip.open(path, 'rb') as g:
         return [line.decode('ascii') for line in g.readlines()]
     
+def unzip_bytes(
+    path: Path,
+) -> bytes:
+    """
+    Reads a gzipped file (of one or more members) returning its bytes.
+    """
+    import gzip
+
+    with gzip.open(path, 'rb') as g:
+        return g.read()
+
+def stream_datafile(
+    path: Path,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Streams a gzipped data file without splitting it into lines. 
+
+    The first item holds the file's two header lines. Every following item
+    holds one block: a line starting with a letter, and every line up to the
+    next such line.
+    """
+    from re import compile, MULTILINE
+    from zlib import decompressobj, MAX_WBITS
+
+    block_start = compile(rb'^[ \t]*[A-Za-z]', MULTILINE)
+
+    buffer = bytearray()
+    preamble: Optional[bytes] = None
+
+    def split_blocks(final: bool) -> Iterator[bytes]:
+        nonlocal preamble
+
+        if preamble is None:
+            # Wait for the file's two header lines
+            if (idx := buffer.find(b'\n', buffer.find(b'\n') + 1)) < 0:
+                return
+            preamble = bytes(buffer[:idx + 1])
+            del buffer[:idx + 1]
+            yield preamble
+
+        starts: list[int] = [m.start() for m in block_start.finditer(buffer)]
+        if final: starts.append(len(buffer))
+        if len(starts) < 2: return
+
+        for start, stop in zip(starts[:-1], starts[1:]):
+            yield bytes(buffer[start:stop])
+
+        del buffer[:starts[-1]]
+
+    # wbits = 16 + MAX_WBITS: expect a gzip header and trailer
+    decompressor = decompressobj(16 + MAX_WBITS)
+    with open(path, 'rb') as f:
+        while (chunk := f.read(chunk_size)):
+            while chunk:
+                buffer += decompressor.decompress(chunk)
+                # Concatenated gzip members
+                if (chunk := decompressor.unused_data):
+                    buffer += decompressor.flush()
+                    decompressor = decompressobj(16 + MAX_WBITS)
+
+            yield from split_blocks(final=False)
+
+    buffer += decompressor.flush()
+    yield from split_blocks(final=True)
+
 def read_datafiles(
     path: Path,
     rec_case: Optional[RecType] = None,
@@ -149,53 +229,231 @@ def read_datafiles(
         if path_is_valid(path_to_file, rec_case=rec_case, z_bounds=z_bounds)
     )
 
-def create_dataframes(
+def parse_datafile(
+    path: Path,
+    data_types: Optional[Iterable[DataType]] = None,
+    use_cache: bool = False,
+    cache_size: Optional[int] = None,
+) -> dict:
+    """
+    Parses a data file into (compacted) physical states, one per data type.
+
+    If 'use_cache' is True, the parsed arrays are read from, or written to, the
+    parse cache (see 'caching').
+    """
+    from .parsing.physical_state import PhysicalState
+
+    if not use_cache:
+        return PhysicalState.from_chunks(
+            stream_datafile(path),
+            data_types = data_types,
+            compact = True,
+        )
+
+    from .caching import load_or_parse, CACHE_SIZE
+
+    return load_or_parse(
+        path,
+        data_types = data_types,
+        max_size = CACHE_SIZE if cache_size is None else cache_size,
+    )
+
+def merge_sorted_runs(
+    runs: list[DataFrame],
+) -> DataFrame:
+    """
+    Merges DataFrames that are each sorted by (n_l, n_u) into a single sorted
+    DataFrame. Rows with equal keys keep their original relative order.
+
+    The keys are packed into a single integer and sorted with a stable sort
+    (timsort), which detects the pre-sorted runs and merges them, i.e. a k-way
+    merge rather than a full sort.
+    """
+    from numpy import argsort, int64
+    from pandas import concat
+
+    if len(runs) == 1: return runs[0]
+
+    df: DataFrame = concat(runs, ignore_index=True)
+    keys = (df['n_l'].to_numpy(dtype=int64) << 16) | df['n_u'].to_numpy(dtype=int64)
+
+    return df.take(argsort(keys, kind='stable')).reset_index(drop=True)
+
+def create_aggregates(
+    df: DataFrame,
+    data_type: DataType,
+    reference: tuple[int, int] = REFERENCE_LINE,
+) -> dict[str, DataFrame]:
+    """
+    Computes the aggregate tables of a data type's DataFrame:
+    - '<data_type>_series':      sums over n_u, i.e. whole series (e.g. Balmer
+                                 for n_l = 2), per (temp, dens).
+    - '<data_type>_lower_totals': sums over n_l per upper level and (temp, dens).
+    - '<data_type>_totals':      sums over all lines per (temp, dens).
+    - '<data_type>_ratios':      every line divided by the reference line at the
+                                 same (temp, dens).
+
+    The DataFrame must contain complete (rec_case, z, temp, dens) grid points,
+    as each chunk of 'iter_sorted_chunks' does.
+    """
+    grid_keys: list[str] = ['rec_case', 'z', 'temp', 'dens']
+
+    def total(keys: list[str]) -> DataFrame:
+        return df.groupby(keys, sort=True, as_index=False)['val'].sum()
+
+    ref = df.loc[
+        (df['n_u'] == reference[0]) & (df['n_l'] == reference[1]),
+        grid_keys + ['val'],
+    ].rename(columns={'val': 'ref'})
+
+    ratios = df.merge(ref, on=grid_keys, how='inner')
+    ratios['val'] = ratios['val'] / ratios.pop('ref')
+
+    return {
+        f"{data_type}_series": total(['rec_case', 'z', 'n_l', 'temp', 'dens']),
+        f"{data_type}_lower_totals": total(['rec_case', 'z', 'n_u', 'temp', 'dens']),
+        f"{data_type}_totals": total(grid_keys),
+        f"{data_type}_ratios": ratios,
+    }
+
+def iter_sorted_chunks(
     path: Path,
     rec_case: Optional[RecType] = None,
     data_types: Optional[Iterable[DataType]] = None,
     z_bounds: tuple[int] = (1, 100),
-) -> dict[DataType, DataFrame]:
+    use_cache: bool = False,
+    cache_size: Optional[int] = None,
+    aggregates: bool = False,
+) -> Iterator[dict[str, DataFrame]]:
     """
-    Scans through a directory's files, reads them, and adds the data to Pandas
-    DataFrames.
+    Scans through a directory's files and yields their data as DataFrames, one
+    per data type, in (rec_case, z, n_l, n_u) order. 
+
+    Each data file covers a single (z, rec_case), known from its name, so files
+    are visited in (rec_case, z) order and only the files sharing a (z, 
+    rec_case) are merged. Only one such group is held in memory at a time.
+
+    If 'aggregates' is True, the aggregate tables of the 'emi' and 'rec' data
+    (see 'create_aggregates') are computed from the same chunks and yielded
+    alongside them.
     """
     from collections import defaultdict
     from pandas import DataFrame
 
-    from .parsing.physical_state import PhysicalState
-
-    read_files_itr = read_datafiles(path, rec_case=rec_case, z_bounds=z_bounds)
+    assert path.exists()
+    assert path.is_dir()
 
     if data_types is None: data_types = {'emi', 'rec', 'opa', 'dep'}
     else:                  data_types = set(data_types)
 
-    all_dicts: dict[str, dict] = {}
-    for dtype in data_types:
-        all_dicts[dtype] = defaultdict(lambda: [])
-    
-    # Read data
-    for read_file in read_files_itr:
-        for dtype in data_types:
-            physical_state = PhysicalState.from_lines(
-                read_file,
-                data_type = dtype,
+    # Group files by (rec_case, z), using the 'rzcttt.d' convention
+    groups: dict[tuple[str, int], list[Path]] = defaultdict(lambda: [])
+    for path_to_file in path.iterdir():
+        if not path_is_valid(path_to_file, rec_case=rec_case, z_bounds=z_bounds):
+            continue
+
+        fname: str = path_to_file.name
+        groups[(fname[2].upper(), int(fname[1]))].append(path_to_file)
+
+    for key in sorted(groups):
+        runs: dict[DataType, list[DataFrame]] = defaultdict(lambda: [])
+
+        for path_to_file in sorted(groups[key]):
+            physical_states = parse_datafile(
+                path_to_file,
+                data_types = data_types,
+                use_cache = use_cache,
+                cache_size = cache_size,
             )
-            
-            for dblock in physical_state.data_blocks:
-                dblock.appendToDict(all_dicts[dtype])
 
-    # Create dataframes
-    all_dfs: dict[DataType, DataFrame] = dict(
+            for dtype, physical_state in physical_states.items():
+                if physical_state.store is None: continue
+
+                runs[dtype].append(
+                    DataFrame(physical_state.toDict()).sort_values(
+                        ['n_l', 'n_u'], 
+                        kind = 'stable',
+                        ignore_index = True,
+                    )
+                )
+
+        chunks: dict[str, DataFrame] = dict(
+            (dtype, merge_sorted_runs(dtype_runs)) \
+            for dtype, dtype_runs in runs.items()
+        )
+
+        if aggregates:
+            for dtype in AGGREGATE_DATA_TYPES:
+                if dtype not in chunks: continue
+                chunks.update(create_aggregates(chunks[dtype], dtype))
+
+        yield chunks
+
+def create_dataframes(
+    path: Path,
+    rec_case: Optional[RecType] = None,
+    data_types: Optional[Iterable[DataType]] = None,
+    z_bounds: tuple[int] = (1, 100),
+    use_cache: bool = False,
+    cache_size: Optional[int] = None,
+    aggregates: bool = False,
+) -> dict[str, DataFrame]:
+    """
+    Scans through a directory's files, reads them, and adds the data to Pandas
+    DataFrames, sorted by (rec_case, z, n_l, n_u). 
+    
+    If 'aggregates' is True, the aggregate tables (see 'create_aggregates') are
+    included.
+    """
+    from collections import defaultdict
+    from pandas import DataFrame, concat
+
+    if data_types is None: data_types = {'emi', 'rec', 'opa', 'dep'}
+    else:                  data_types = set(data_types)
+
+    all_chunks: dict[DataType, list[DataFrame]] = defaultdict(lambda: [])
+    for chunks in iter_sorted_chunks(
+        path,
+        rec_case = rec_case,
+        data_types = data_types,
+        z_bounds = z_bounds,
+        use_cache = use_cache,
+        cache_size = cache_size,
+        aggregates = aggregates,
+    ):
+        for table_name, df in chunks.items():
+            all_chunks[table_name].append(df)
+
+    # Chunks are already in order, so they are simply concatenated
+    all_dfs: dict[str, DataFrame] = dict(
         (
-            dtype, 
-            DataFrame(data).sort_values(['rec_case', 'z', 'n_l', 'n_u']),
+            table_name,
+            concat(all_chunks[table_name], ignore_index=True) \
+                if all_chunks[table_name] else DataFrame(),
         ) \
-        for dtype, data \
-        in all_dicts.items()
+        for table_name in (*data_types, *sorted(all_chunks.keys() - data_types))
     )
 
     return all_dfs
 
+def write_chunks_to_db(
+    chunks_itr: Iterable[dict[str, DataFrame]],
+    connection: Connection,
+    if_exists: Literal['append', 'replace', 'fail'] = 'append',
+) -> None:
+    """
+    Writes chunks (see 'iter_sorted_chunks') to the database as they arrive,
+    so the tables are filled in key order without holding all data in memory.
+    """
+    for idx, chunks in enumerate(chunks_itr):
+        write_dfs_to_db(
+            chunks,
+            connection,
+            if_exists = if_exists if idx == 0 else 'append',
+        )
+
+    connection.commit()
+
 def write_dfs_to_db(
     dataframes: dict[DataType, DataFrame],
     connection: Connection,
@@ -0,0 +1,21 @@
+"""
+Test configuration: makes 'src' importable when running pytest from the
+repository root, as the scripts do.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+if (pkg_path := Path(__file__).parents[1]) not in sys.path:
+    sys.path.append(str(pkg_path))
+
+@pytest.fixture
+def db_dir(tmp_path, monkeypatch):
+    """
+    Directory in which databases are looked up and created.
+    """
+    from src.utils import writing
+
+    monkeypatch.setattr(writing, 'db_dir', tmp_path)
+    return tmp_path
@@ -0,0 +1,103 @@
+"""
+Sample data shared by the tests.
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from src.utils.funcs import calculateWave
+
+# Excerpt in the SH1995 layout: two header lines, then blocks of 13-character
+# (n_l, value) words, starting at the second character of each line
+SAMPLE: str = """\
+ SH1995 HYDROGENIC RECOMBINATION DATA
+ Z= 1 CASE= B 200
+  E_NU= 2 NE=1.000E+02 TE=1.000E+04 Z= 1 CASE=B
+   1 8.783E-26
+  E_NU= 3 NE=1.000E+02 TE=1.000E+04 Z= 1 CASE=B
+   1 2.616E-26  2 2.831E-26
+  E_NU=200 NE=1.000E+02 TE=1.000E+04 Z= 1 CASE=B
+ 101 1.234-105102 9.870-106103 1.001E-99104 5.000E+00105 3.210-101
+ 106 7.700E-05
+  R_NU= 3 NE=1.000E+02 TE=1.000E+04 Z= 1 CASE=B
+   1 1.500E-14  2 2.500E-14
+  B_NU= 2 NE=1.000E+02 TE=1.000E+04 Z= 1 CASE=B
+   0 9.000E-01  1 9.500E-01
+ BNS
+   1 1.000E+00  2 9.200E-01
+  E_NU= 2 NE=1.000E+04 TE=1.000E+04 Z= 1 CASE=B
+   1 8.891E-26
+"""
+
+def sample_lines() -> list[str]:
+    return SAMPLE.splitlines(keepends=True)
+
+def write_gzip(path, text: str, n_members: int = 1):
+    """
+    Writes the text as a gzip file made of several concatenated members, split
+    at arbitrary positions (mid-line included).
+    """
+    from gzip import compress
+
+    data: bytes = text.encode('ascii')
+    bounds = np.linspace(0, len(data), n_members + 1).astype(int)
+    path.write_bytes(b''.join(
+        compress(data[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])
+    ))
+    return path
+
+def sample_value(z, n_u, n_l, temp, dens) -> float:
+    return z**3 * temp**-0.8 * dens**0.05 * n_l * n_u**-3. * 1e-20
+
+def make_datafile(
+    z: int,
+    rec_case: str,
+    temps: tuple[float, ...],
+    denss: tuple[float, ...],
+    n_c: int = 6,
+    letters: str = 'ER',
+) -> str:
+    """
+    Returns the text of a data file in the SH1995 layout, with a block of
+    'sample_value's per data type letter, upper level and (temp, dens).
+    """
+    lines: list[str] = [
+        " SH1995 HYDROGENIC RECOMBINATION DATA\n",
+        f" Z= {z} CASE= {rec_case} {n_c}\n",
+    ]
+    for temp in temps:
+        for dens in denss:
+            for letter in letters:
+                for n_u in range(2, n_c + 1):
+                    lines.append(
+                        f"  {letter}_NU= {n_u} NE={dens:.3E} TE={temp:.3E} "
+                        f"Z= {z} CASE={rec_case}\n"
+                    )
+                    words = [
+                        f"{n_l:3d} {sample_value(z, n_u, n_l, temp, dens):.3E}"
+                        for n_l in range(1, n_u)
+                    ]
+                    for start in range(0, len(words), 5):
+                        lines.append(' ' + ''.join(words[start:start + 5]) + '\n')
+
+    return ''.join(lines)
+
+COLUMNS: list[str] = ['wave', 'rec_case', 'z', 'n_u', 'n_l', 'temp', 'dens', 'val']
+
+def write_emi_db(path, zs=(1, 2)) -> None:
+    # Exactly hydrogenic: val(z, T, N) = z^3 f(T / z^2, N / z^7)
+    rows = [
+        (
+            calculateWave(n_l, n_u, z), 'B', z, n_u, n_l,
+            temp * z**2, dens * z**7,
+            z**3 * temp**-0.8 * dens**0.05 * n_l * n_u**-3.,
+        )
+        for z in zs
+        for n_u in range(2, 11)
+        for n_l in range(1, n_u)
+        for temp in (1e3, 1e4, 3e4)
+        for dens in (1e2, 1e4)
+    ]
+    with sqlite3.connect(path) as connection:
+        pd.DataFrame(rows, columns=COLUMNS).to_sql('emi', connection, index=False)
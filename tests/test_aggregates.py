@@ -0,0 +1,83 @@
+"""
+Tests for the aggregate tables.
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from src.utils.writing import iter_sorted_chunks, write_chunks_to_db
+
+from samples import make_datafile, sample_value, write_gzip
+
+TEMPS: tuple[float, ...] = (1e3, 1e4)
+DENSS: tuple[float, ...] = (1e2, 1e4)
+N_C: int = 6
+
+def make_db(tmp_path) -> sqlite3.Connection:
+    path = tmp_path / 'data'
+    path.mkdir()
+    write_gzip(path / 'r1b0100.d.gz', make_datafile(1, 'B', TEMPS, DENSS, n_c=N_C))
+    write_gzip(path / 'r2b0100.d.gz', make_datafile(2, 'B', TEMPS, DENSS, n_c=N_C))
+
+    connection = sqlite3.connect(tmp_path / 'db.db')
+    write_chunks_to_db(iter_sorted_chunks(path, aggregates=True), connection)
+    return connection
+
+def read(connection, table: str) -> pd.DataFrame:
+    return pd.read_sql_query(f"SELECT * FROM {table}", connection)
+
+def test_aggregates_per_grid_point(tmp_path):
+    connection = make_db(tmp_path)
+
+    for table in ('emi', 'rec'):
+        series = read(connection, f"{table}_series")
+        lower_totals = read(connection, f"{table}_lower_totals")
+        totals = read(connection, f"{table}_totals")
+
+        # One row per (z, temp, dens) and n_l, n_u, or grid point
+        n_points: int = 2 * len(TEMPS) * len(DENSS)
+        assert len(series) == n_points * (N_C - 1)
+        assert len(lower_totals) == n_points * (N_C - 1)
+        assert len(totals) == n_points
+
+        for row in series.itertuples():
+            assert np.isclose(row.val, sum(
+                sample_value(row.z, n_u, row.n_l, row.temp, row.dens) \
+                for n_u in range(row.n_l + 1, N_C + 1)
+            ), rtol=1e-3)
+        for row in lower_totals.itertuples():
+            assert np.isclose(row.val, sum(
+                sample_value(row.z, row.n_u, n_l, row.temp, row.dens) \
+                for n_l in range(1, row.n_u)
+            ), rtol=1e-3)
+        for row in totals.itertuples():
+            assert np.isclose(row.val, sum(
+                sample_value(row.z, n_u, n_l, row.temp, row.dens) \
+                for n_u in range(2, N_C + 1) for n_l in range(1, n_u)
+            ), rtol=1e-3)
+
+    connection.close()
+
+def test_ratios_to_h_beta(tmp_path):
+    connection = make_db(tmp_path)
+
+    for table in ('emi', 'rec'):
+        base = read(connection, table)
+        ratios = read(connection, f"{table}_ratios")
+        assert len(ratios) == len(base)
+
+        keys = ['rec_case', 'z', 'n_u', 'n_l', 'temp', 'dens']
+        merged = base.merge(ratios, on=keys, suffixes=('', '_ratio'))
+        h_beta = base[(base['n_u'] == 4) & (base['n_l'] == 2)] \
+            .set_index(['z', 'temp', 'dens'])['val']
+
+        expected = merged['val'] / h_beta.loc[
+            list(zip(merged['z'], merged['temp'], merged['dens']))
+        ].to_numpy()
+        assert np.allclose(merged['val_ratio'], expected, rtol=1e-12)
+
+        at_h_beta = merged[(merged['n_u'] == 4) & (merged['n_l'] == 2)]
+        assert np.allclose(at_h_beta['val_ratio'], 1.)
+
+    connection.close()
@@ -0,0 +1,108 @@
+"""
+Tests for the parse cache.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from src.utils import caching
+from src.utils.caching import (
+    get_cache_path, load_or_parse, save_physical_states, evict,
+)
+from src.utils.parsing import PhysicalState
+from src.utils.writing import stream_datafile
+
+from samples import SAMPLE, sample_lines, write_gzip
+
+def assert_states_equal(physical_states, data_types=('emi', 'rec', 'dep')):
+    for data_type in data_types:
+        expected = PhysicalState.from_lines(sample_lines(), data_type)
+        assert physical_states[data_type].toDataFrame() \
+            .equals(expected.toDataFrame())
+
+def test_round_trip(tmp_path):
+    path = write_gzip(tmp_path / 'r1b0100.d.gz', SAMPLE)
+    cache = tmp_path / 'cache'
+
+    assert_states_equal(load_or_parse(path, directory=cache))
+    (entry,) = cache.glob('*.npz')
+    assert entry == get_cache_path(path, directory=cache)
+
+    # Served from the cache, for any subset of data types
+    os.utime(path, (0, 0))
+    loaded = load_or_parse(path, data_types=['dep', 'opa'], directory=cache)
+    assert set(loaded) == {'dep', 'opa'}
+    assert_states_equal(loaded, data_types=['dep'])
+    assert loaded['opa'].store is None
+    assert list(cache.glob('*.npz')) == [entry]
+
+def test_parser_version_invalidates(tmp_path, monkeypatch):
+    path = write_gzip(tmp_path / 'r1b0100.d.gz', SAMPLE)
+    cache = tmp_path / 'cache'
+
+    old_entry = get_cache_path(path, directory=cache)
+    load_or_parse(path, directory=cache)
+
+    monkeypatch.setattr(caching, 'PARSER_VERSION', caching.PARSER_VERSION + 1)
+    new_entry = get_cache_path(path, directory=cache)
+    assert new_entry != old_entry
+
+    assert_states_equal(load_or_parse(path, directory=cache))
+    assert new_entry.exists() and old_entry.exists()
+
+def test_atomic_write(tmp_path, monkeypatch):
+    path = write_gzip(tmp_path / 'r1b0100.d.gz', SAMPLE)
+    entry = get_cache_path(path, directory=tmp_path / 'cache')
+    physical_states = PhysicalState.from_chunks(
+        stream_datafile(path), compact=True,
+    )
+
+    def savez(f, **arrays):
+        f.write(b'partial')
+        raise OSError("disk full")
+
+    monkeypatch.setattr(np, 'savez', savez)
+    with pytest.raises(OSError):
+        save_physical_states(physical_states, entry)
+
+    # Neither a truncated entry nor the temporary file is left behind
+    assert list(entry.parent.iterdir()) == []
+
+    monkeypatch.undo()
+    save_physical_states(physical_states, entry)
+    assert list(entry.parent.iterdir()) == [entry]
+
+def test_evict_least_recently_used(tmp_path):
+    sizes: dict[str, int] = {'a': 100, 'b': 200, 'c': 300}
+    for age, (name, size) in enumerate(sizes.items()):
+        entry = tmp_path / f"{name}.npz"
+        entry.write_bytes(b'\0' * size)
+        os.utime(entry, (1000 - age, 1000 - age))
+
+    # 'c' is the oldest, then 'b'
+    assert evict(directory=tmp_path, max_size=600) == []
+    assert evict(directory=tmp_path, max_size=250) == [
+        tmp_path / 'c.npz', tmp_path / 'b.npz',
+    ]
+    assert [p.name for p in tmp_path.iterdir()] == ['a.npz']
+
+def test_load_marks_entry_used(tmp_path):
+    cache = tmp_path / 'cache'
+    paths = [
+        write_gzip(tmp_path / f"r1b010{idx}.d.gz", SAMPLE + ' ' * idx)
+        for idx in range(3)
+    ]
+
+    for idx, path in enumerate(paths[:2]):
+        load_or_parse(path, directory=cache)
+        os.utime(get_cache_path(path, directory=cache), (idx, idx))
+
+    # Using the older entry makes the other one the least recently used
+    load_or_parse(paths[0], directory=cache)
+    size: int = get_cache_path(paths[0], directory=cache).stat().st_size
+
+    load_or_parse(paths[2], directory=cache, max_size=2 * size + size // 2)
+    assert get_cache_path(paths[0], directory=cache).exists()
+    assert not get_cache_path(paths[1], directory=cache).exists()
+    assert get_cache_path(paths[2], directory=cache).exists()
@@ -0,0 +1,141 @@
+"""
+Tests for the (temp, dens) grid and line-ratio diagnostics.
+"""
+import numpy as np
+import pytest
+
+from src.utils.grid import Grid
+from src.utils.diagnostics import solve_line_ratios, interpolate_ratios
+
+def make_grid() -> Grid:
+    # Temperature axis that is not log-uniform, as in SH1995
+    temps = np.array([5e2, 1e3, 3e3, 5e3, 7.5e3, 1e4])
+    denss = np.array([1e2, 1e3, 1e4, 1e5])
+    tt, dd = np.meshgrid(temps, denss, indexing='ij')
+
+    values = np.stack([
+        tt**-0.8 * dd**0.1,
+        2 * tt**-0.5,
+        3 * tt**-0.9 * dd**0.05,
+    ], axis=-1)
+
+    return Grid(
+        'emi', 'B', 1,
+        temps = temps,
+        denss = denss,
+        transitions = np.array([[3, 2], [4, 2], [5, 2]]),
+        values = values,
+    )
+
+def cell_points(grid: Grid, n: int = 50) -> tuple[np.ndarray, np.ndarray]:
+    # Random points within cells, clear of their edges, so that finite
+    # differences do not cross into neighbouring cells
+    rng = np.random.default_rng(0)
+    xs, ys = grid.log_temps, grid.log_denss
+
+    i = rng.integers(0, xs.size - 1, n)
+    j = rng.integers(0, ys.size - 1, n)
+    u, v = rng.uniform(0.1, 0.9, (2, n))
+
+    return 10**(xs[i] + u * (xs[i + 1] - xs[i])), \
+        10**(ys[j] + v * (ys[j + 1] - ys[j]))
+
+def finite_differences(func, temp, dens, h: float = 1e-6) -> tuple:
+    # Central differences with respect to log10 temp and log10 dens
+    up, down = 10**h, 10**-h
+    return (
+        (func(temp * up, dens) - func(temp * down, dens)) / (2 * h),
+        (func(temp, dens * up) - func(temp, dens * down)) / (2 * h),
+    )
+
+def make_rough_grid() -> Grid:
+    # Not a power law, so that gradients differ between cells
+    grid = make_grid()
+    rng = np.random.default_rng(1)
+    grid.values *= np.exp(rng.normal(0, 0.3, grid.values.shape))
+    return grid
+
+@pytest.mark.parametrize('log_values', [True, False])
+def test_interpolate_gradient(log_values):
+    grid = make_rough_grid()
+    temp, dens = cell_points(grid)
+
+    values, d_dx, d_dy = grid.interpolate(
+        temp, dens, log_values=log_values, gradient=True,
+    )
+    fd_dx, fd_dy = finite_differences(
+        lambda t, d: grid.interpolate(t, d, log_values=log_values), temp, dens,
+    )
+
+    assert np.array_equal(values, grid.interpolate(temp, dens, log_values=log_values))
+    assert np.allclose(d_dx, fd_dx, rtol=1e-6, atol=0)
+    assert np.allclose(d_dy, fd_dy, rtol=1e-6, atol=0)
+
+    # Off the grid
+    off = grid.interpolate(1e5, 1e3, log_values=log_values, gradient=True)
+    assert all(np.isnan(arr).all() for arr in off)
+
+def test_interpolate_ratios_gradient():
+    grid = make_rough_grid()
+    ratios = [((3, 2), (4, 2)), ((5, 2), (3, 2)), ((4, 2), (5, 2))]
+    temp, dens = cell_points(grid)
+
+    out, d_dx, d_dy = interpolate_ratios(grid, ratios, temp, dens, gradient=True)
+    fd_dx, fd_dy = finite_differences(
+        lambda t, d: interpolate_ratios(grid, ratios, t, d), temp, dens,
+    )
+
+    assert np.array_equal(out, interpolate_ratios(grid, ratios, temp, dens))
+    assert np.allclose(d_dx, fd_dx, rtol=1e-6, atol=0)
+    assert np.allclose(d_dy, fd_dy, rtol=1e-6, atol=0)
+
+def test_refine_keeps_nodes():
+    grid = make_grid()
+    refined = grid.refine(4)
+
+    assert refined.temps.size == 4 * (grid.temps.size - 1) + 1
+    assert np.isin(grid.temps, refined.temps).all()
+    assert np.isin(grid.denss, refined.denss).all()
+
+    i = np.searchsorted(refined.temps, grid.temps)
+    j = np.searchsorted(refined.denss, grid.denss)
+    assert np.allclose(refined.values[np.ix_(i, j)], grid.values)
+
+def test_unobserved_invalid_ratio_does_not_mask_point():
+    grid = make_grid()
+    ratios = [((3, 2), (4, 2)), ((5, 2), (4, 2))]
+
+    # The second ratio cannot be modelled at the true point
+    grid.values[2, 1, 2] = np.nan
+    truth = grid.values[2, 1, 0] / grid.values[2, 1, 1]
+
+    observed = np.array([[truth, np.nan], [truth, 1.]])
+    sigma = np.array([[0.01 * truth, np.nan], [0.01 * truth, 1.]])
+
+    result = solve_line_ratios(grid, ratios, observed, sigma, refine=1)
+
+    # Only the spectrum observing the invalid ratio loses the point
+    assert (result.temp[0], result.dens[0]) == (grid.temps[2], grid.denss[1])
+    assert (result.temp[1], result.dens[1]) != (grid.temps[2], grid.denss[1])
+
+def test_spectra_without_usable_ratios():
+    grid = make_grid()
+    ratios = [((3, 2), (4, 2)), ((5, 2), (4, 2))]
+
+    # The second ratio cannot be modelled anywhere
+    grid.values[..., 2] = np.nan
+    truth = grid.values[2, 1, 0] / grid.values[2, 1, 1]
+
+    observed = np.array([[truth, np.nan], [np.nan, np.nan], [truth, 1.]])
+    sigma = np.array([[0.01 * truth, np.nan], [np.nan, np.nan], [0.01, 0.01]])
+
+    result = solve_line_ratios(
+        grid, ratios, observed, sigma, refine=1, return_likelihood=True,
+    )
+
+    assert (result.temp[0], result.dens[0]) == (grid.temps[2], grid.denss[1])
+    assert np.isclose(result.likelihood[0].sum(), 1.)
+
+    for idx in (1, 2):
+        assert np.isnan([result.temp[idx], result.dens[idx], result.chi2[idx]]).all()
+        assert np.isnan(result.likelihood[idx]).all()
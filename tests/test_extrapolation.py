@@ -0,0 +1,116 @@
+"""
+Tests for the extrapolation beyond the highest tabulated level.
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.extrapolation import (
+    Extrapolation, get_extrapolation, load_extrapolation, _get_extrapolation,
+)
+
+N_C: int = 12
+
+def write_emi(path, zs=(1,)) -> None:
+    rows = [
+        ('B', z, n_u, n_l, temp, dens, z**3 * temp**-0.5 * n_l * n_u**-3.)
+        for z in zs
+        for n_u in range(2, N_C + 1)
+        for n_l in range(1, n_u)
+        for temp in (1e3, 1e4, 3e4)
+        for dens in (1e2, 1e4)
+    ]
+    with sqlite3.connect(path) as connection:
+        pd.DataFrame(
+            rows, columns=['rec_case', 'z', 'n_u', 'n_l', 'temp', 'dens', 'val'],
+        ).to_sql('emi', connection, index=False)
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    _get_extrapolation.cache_clear()
+    yield
+    _get_extrapolation.cache_clear()
+
+def test_store_different_orders(db_dir):
+    write_emi(db_dir / 'db.db')
+
+    get_extrapolation('emi', 1, 'B', order=0, store=True)
+    _get_extrapolation.cache_clear()
+    extrap = get_extrapolation('emi', 1, 'B', order=1, store=True)
+
+    stored = load_extrapolation('emi', 1, 'B')
+    assert (stored.order, stored.n_fit) == (1, extrap.n_fit)
+    assert np.allclose(stored.coeffs, extrap.coeffs)
+
+def test_stored_n_fit_mismatch(db_dir):
+    write_emi(db_dir / 'db.db')
+
+    get_extrapolation('emi', 1, 'B', n_fit=4, store=True)
+    _get_extrapolation.cache_clear()
+
+    assert get_extrapolation('emi', 1, 'B', n_fit=6).n_fit == 6
+    assert get_extrapolation('emi', 1, 'B', n_fit=4).n_fit == 4
+
+def test_evaluate_unfitted_series(db_dir):
+    write_emi(db_dir / 'db.db')
+    extrap: Extrapolation = get_extrapolation('emi', 1, 'B', n_fit=4)
+
+    assert extrap.evaluate([20, 30], n_ls=[2, 1]).shape[-2:] == (2, 2)
+    for n_ls in ([0], [N_C - 3], [1, 50]):
+        with pytest.raises(KeyError):
+            extrap.evaluate([20], n_ls=n_ls)
+
+def test_federated_names(db_dir):
+    write_emi(db_dir / 'a.db', zs=(1,))
+    write_emi(db_dir / 'b.db', zs=(2,))
+
+    extrap = get_extrapolation('emi', 2, 'B', name=['a', 'b'], store=True)
+    assert extrap.z == 2
+    assert load_extrapolation('emi', 2, 'B', name='a').n_fit == extrap.n_fit
+
+def test_points_tabulated_to_different_levels(db_dir):
+    # One temperature is only tabulated up to n_u = 10
+    write_emi(db_dir / 'db.db')
+    with sqlite3.connect(db_dir / 'db.db') as connection:
+        connection.execute("DELETE FROM emi WHERE temp == 3e4 AND n_u > 10")
+
+    extrap: Extrapolation = get_extrapolation('emi', 1, 'B', n_fit=4, store=True)
+
+    assert extrap.n_c.tolist() == [[12, 12], [12, 12], [10, 10]]
+    assert np.array_equal(load_extrapolation('emi', 1, 'B').n_c, extrap.n_c)
+    assert extrap.n_ls.tolist() == list(range(1, 7))
+    assert np.isfinite(extrap.coeffs).all()
+
+    temps = extrap.temps[:, None, None, None]
+    n_ls = extrap.n_ls[:, None]
+    expected = temps**-0.5 * n_ls * np.array([20., 30.])**-3.
+    assert np.allclose(extrap.evaluate([20, 30]), expected)
+
+def test_from_grid_missing_transitions():
+    from src.utils.grid import Grid
+
+    n_us, n_ls = np.meshgrid(np.arange(2, N_C + 1), np.arange(1, N_C))
+    sel = (n_ls < n_us) & ~((n_us == N_C) & (n_ls == 2))
+    n_us, n_ls = n_us[sel], n_ls[sel]
+
+    # (N_C, 2) is absent everywhere, (N_C - 1, 3) at a single point
+    grid = Grid.from_records('emi', 'B', 1, {
+        'n_u': np.repeat(n_us, 2),
+        'n_l': np.repeat(n_ls, 2),
+        'temp': np.tile([1e3, 1e4], n_us.size),
+        'dens': np.full(2 * n_us.size, 1e2),
+        'val': np.tile([1e3, 1e4], n_us.size)**-0.5 * np.repeat(n_ls * n_us**-3., 2),
+    })
+    grid.values[0, 0, grid.indicesOf([(N_C - 1, 3)])] = np.nan
+
+    extrap = Extrapolation.from_grid(grid, n_fit=4)
+    finite = np.isfinite(extrap.coeffs).all(axis=-1)
+
+    assert not finite[:, :, 1].any()
+    assert finite[:, :, 2].tolist() == [[False], [True]]
+    assert finite[:, :, [0, 3, 4, 5, 6, 7]].all()
+
+    # Capping the levels leaves the fit clear of both
+    assert np.isfinite(Extrapolation.from_grid(grid, n_fit=4, n_c=N_C - 2).coeffs).all()
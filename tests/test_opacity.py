@@ -0,0 +1,79 @@
+"""
+Tests for correcting emissivities for line opacity.
+"""
+import numpy as np
+import pytest
+
+from src.utils.grid import Grid
+from src.utils.opacity import OpacityCorrection, escape_probability
+
+TEMPS = np.array([5e3, 1e4, 2e4])
+DENSS = np.array([1e2, 1e4])
+
+def make_grid(table, transitions, values) -> Grid:
+    # Power laws in temp, which log-bilinear interpolation reproduces exactly
+    scale = (TEMPS / 1e4)**-0.5
+    return Grid(
+        table, 'B', 1,
+        temps = TEMPS,
+        denss = DENSS,
+        transitions = np.array(transitions),
+        values = scale[:, None, None] * np.ones((1, DENSS.size, 1)) \
+            * np.array(values)[None, None, :],
+    )
+
+@pytest.fixture
+def grids():
+    emi = make_grid('emi', [(3, 2), (4, 2), (4, 3)], [3e-25, 1e-25, 5e-26])
+    opa = make_grid('opa', [(3, 2), (4, 2), (5, 2)], [2e-14, 5e-15, 2e-15])
+    return emi, opa
+
+def test_escape_probability():
+    tau = np.array([0., 1e-12, 0.5, 1., 50.])
+    beta = escape_probability(tau)
+
+    assert beta[0] == 1.
+    assert np.isclose(beta[1], 1.)
+    assert np.isclose(beta[2], 0.786938680574733)
+    assert np.isclose(beta[3], 0.6321205588285577)
+    assert np.isclose(beta[4], 0.02)
+
+def test_correct_with_column(grids):
+    correction = OpacityCorrection.from_grids(*grids)
+
+    # Only the transitions common to both grids
+    assert correction.transitions.tolist() == [[3, 2], [4, 2]]
+
+    # tau = 2e-14 * 5e13 = 1 and 5e-15 * 5e13 = 0.25 at 1e4 K
+    emi, opa = correction.interpolate(1e4, 1e3)
+    tau = correction.opticalDepths(opa, column=[5e13])
+    assert np.allclose(tau, [[1., 0.25]])
+
+    corrected = correction.correct([1e4, 4e4], [1e3, 1e3], column=5e13)
+    assert np.allclose(corrected[0], [
+        3e-25 * 0.6321205588285577, 1e-25 * 0.8847968677143805,
+    ])
+    # Off the grid
+    assert np.isnan(corrected[1]).all()
+
+def test_correct_with_reference(grids):
+    correction = OpacityCorrection.from_grids(*grids, reference=(3, 2))
+
+    # Opacity factors are relative to the reference, at every temperature
+    _, opa = correction.interpolate([7e3, 1.5e4], [1e3, 1e2])
+    assert np.allclose(opa, [[1., 0.25], [1., 0.25]])
+
+    # tau(4, 2) = 2 * 5e-15 / 2e-14 = 0.5, whatever the temperature
+    scale = (7e3 / 1e4)**-0.5
+    corrected = correction.correct(7e3, 1e3, tau_ref=[[2., 2.]])
+    assert np.allclose(corrected, [[
+        scale * 3e-25 * 0.43233235838169365, scale * 1e-25 * 0.786938680574733,
+    ]])
+
+def test_optical_depths_requires_one_source(grids):
+    correction = OpacityCorrection.from_grids(*grids)
+    _, opa = correction.interpolate(1e4, 1e3)
+
+    for kwargs in ({}, {'column': 1., 'tau_ref': 1.}):
+        with pytest.raises(ValueError):
+            correction.opticalDepths(opa, **kwargs)
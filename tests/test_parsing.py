@@ -0,0 +1,116 @@
+"""
+Tests for the fixed-width parser of SH1995 data files.
+"""
+import numpy as np
+import pytest
+
+from src.utils.funcs import calculateWave
+from src.utils.parsing import DataBlock, PhysicalState
+from src.utils.parsing.data_block import NL_DTYPE, parse_words, parse_float
+from src.utils.writing import stream_datafile, unzip_bytes
+
+from samples import SAMPLE, sample_lines, write_gzip
+
+def test_append_to_dict_wave_int16_nls():
+    # n_l**2 overflows int16 above 181
+    dblock = DataBlock(
+        1e2, 1e4, 1, 500, 'B', 'emi',
+        nls = np.array([1, 181, 182, 300, 499], dtype=NL_DTYPE),
+        data = np.ones(5),
+    )
+    d = dblock.toDict()
+
+    expected = [calculateWave(nl, 500, 1) for nl in (1, 181, 182, 300, 499)]
+    assert np.allclose(d['wave'], expected)
+    assert all(wave > 0 for wave in d['wave'])
+
+def sample_state(source: str, data_type: str, **kwargs) -> PhysicalState:
+    if source == 'lines':
+        return PhysicalState.from_lines(sample_lines(), data_type, **kwargs)
+    return PhysicalState.from_bytes(SAMPLE.encode('ascii'), data_type, **kwargs)
+
+@pytest.mark.parametrize('source', ['lines', 'bytes'])
+@pytest.mark.parametrize('lazy', [False, True])
+def test_get_specific_stat_missing_transition(source, lazy):
+    physical_state = sample_state(source, 'emi', lazy=lazy)
+
+    td = (1e4, 1e2)
+    assert physical_state.getSpecificStat(td, (3, 2)) == 2.831e-26
+
+    with pytest.raises(KeyError):
+        physical_state.getSpecificStat(td, (3, 7))
+    with pytest.raises(KeyError):
+        physical_state.getSpecificStat(td, (9, 1))
+
+def test_parse_float_exponent_forms():
+    assert parse_float('1.234E-05') == 1.234e-05
+    assert parse_float('1.234-105') == 1.234e-105
+    assert parse_float('5.000E+00') == 5.
+
+def test_parse_words():
+    body: bytes = (
+        " 101 1.234-105102 9.870-106103 1.001E-99104 5.000E+00105 3.210-101\n"
+        " 106 7.700E-05\n"
+    ).encode('ascii')
+    nls, data = parse_words(body)
+
+    assert nls.dtype == NL_DTYPE
+    assert nls.tolist() == [101, 102, 103, 104, 105, 106]
+    assert data.tolist() == [1.234e-105, 9.87e-106, 1.001e-99, 5., 3.21e-101, 7.7e-05]
+
+def test_parse_words_matches_parse_lines():
+    lines = sample_lines()
+    start = next(i for i, line in enumerate(lines) if line.startswith('  E_NU=200'))
+    block = ''.join(lines[start:start + 3])
+
+    from_bytes = DataBlock.from_bytes(block.encode('ascii'))
+    from_lines = DataBlock.from_lines(lines[start:start + 3])
+
+    assert from_bytes.n_u == from_lines.n_u == 200
+    assert np.array_equal(from_bytes.nls, from_lines.nls)
+    assert np.array_equal(from_bytes.data, from_lines.data)
+
+@pytest.mark.parametrize('n_members', [1, 3])
+@pytest.mark.parametrize('chunk_size', [7, 1 << 16])
+def test_stream_datafile(tmp_path, n_members, chunk_size):
+    path = write_gzip(tmp_path / 'r1b0100.d.gz', SAMPLE, n_members=n_members)
+    chunks = list(stream_datafile(path, chunk_size=chunk_size))
+
+    # Nothing is lost or duplicated, and every block starts a chunk
+    assert b''.join(chunks).decode('ascii') == SAMPLE
+    assert chunks[0].decode('ascii') == ''.join(sample_lines()[:2])
+    assert [c.decode('ascii').split('\n')[0] for c in chunks[1:]] == [
+        line.rstrip('\n') for line in sample_lines()[2:] \
+        if line.strip()[0].isalpha()
+    ]
+
+@pytest.mark.parametrize('n_members', [1, 3])
+@pytest.mark.parametrize('chunk_size', [7, 1 << 16])
+def test_from_chunks_matches_from_lines(tmp_path, n_members, chunk_size):
+    path = write_gzip(tmp_path / 'r1b0100.d.gz', SAMPLE, n_members=n_members)
+    physical_states = PhysicalState.from_chunks(
+        stream_datafile(path, chunk_size=chunk_size),
+    )
+
+    for data_type in ('emi', 'rec', 'dep'):
+        expected = PhysicalState.from_lines(sample_lines(), data_type)
+        physical_state = physical_states[data_type]
+
+        assert (physical_state.z, physical_state.rec_case, physical_state.n_c) \
+            == (expected.z, expected.rec_case, expected.n_c) == (1, 'B', 200)
+        assert physical_state.toDataFrame().equals(expected.toDataFrame())
+
+    assert physical_states['opa'].data_blocks is None
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_from_bytes_matches_from_lines(tmp_path, lazy):
+    data: bytes = unzip_bytes(write_gzip(tmp_path / 'r1b0100.d.gz', SAMPLE, 3))
+
+    for data_type in ('emi', 'rec', 'dep'):
+        expected = PhysicalState.from_lines(sample_lines(), data_type)
+        physical_state = PhysicalState.from_bytes(data, data_type, lazy=lazy)
+
+        # Lazy instances hold the bytes, not the file's lines
+        assert physical_state.is_lazy == lazy
+        assert isinstance(physical_state.source, bytes) == lazy
+        assert physical_state.toDataFrame().equals(expected.toDataFrame())
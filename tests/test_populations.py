@@ -0,0 +1,79 @@
+"""
+Tests for level populations and departure coefficients.
+"""
+import numpy as np
+import pytest
+
+from src.utils.grid import Grid
+from src.utils.parsing import PhysicalState
+from src.utils.populations import (
+    departure_coefficients, sublevel_departure_coefficients,
+)
+
+from samples import SAMPLE, sample_lines
+
+def make_dep_grid(transitions) -> Grid:
+    temps = np.array([1e3, 1e4])
+    denss = np.array([1e2, 1e4])
+    transitions = np.array(transitions)
+
+    # b(n, l) = 1 - 1 / (n + l), independent of (temp, dens)
+    values = 1 - 1 / transitions.sum(axis=1).astype(float)
+
+    return Grid(
+        'dep', 'B', 1,
+        temps = temps,
+        denss = denss,
+        transitions = transitions,
+        values = np.broadcast_to(values, (2, 2, values.size)).copy(),
+    )
+
+def test_departure_coefficients_weights_sublevels():
+    grid = make_dep_grid([(2, 0), (2, 1), (3, 0), (3, 1), (3, 2)])
+
+    b = departure_coefficients(grid, [3e3, 5e3], [1e3, 1e3], [2, 3, 4])
+
+    b_2 = (1 * (1 - 1/2) + 3 * (1 - 1/3)) / 4
+    b_3 = (1 * (1 - 1/3) + 3 * (1 - 1/4) + 5 * (1 - 1/5)) / 9
+    assert np.allclose(b[:, :2], [b_2, b_3])
+    assert np.isnan(b[:, 2]).all()
+
+    assert np.allclose(
+        sublevel_departure_coefficients(grid, 3e3, 1e3, [(3, 2), (2, 0)]),
+        [[1 - 1/5, 1 - 1/2]],
+    )
+
+def test_departure_coefficients_incomplete_level():
+    grid = make_dep_grid([(2, 0), (2, 1), (3, 0), (3, 2)])
+
+    assert np.isfinite(departure_coefficients(grid, 3e3, 1e3, [2])).all()
+    with pytest.raises(ValueError, match=r'n = \[3\]'):
+        departure_coefficients(grid, 3e3, 1e3, [2, 3])
+
+def test_departure_coefficients_not_l_resolved():
+    # b_n stored per level, rather than per sublevel
+    grid = make_dep_grid([(2, 2), (3, 3)])
+
+    with pytest.raises(ValueError):
+        departure_coefficients(grid, 3e3, 1e3, [2, 3])
+
+@pytest.mark.parametrize('source', ['lines', 'bytes'])
+def test_departure_coefficients_from_data_file(source):
+    # The sample's B_NU= 2 block lists b(2, l) by l (from 0), and its BNS
+    # line, which is not part of the block, is skipped
+    if source == 'lines':
+        physical_state = PhysicalState.from_lines(sample_lines(), 'dep')
+    else:
+        physical_state = PhysicalState.from_bytes(SAMPLE.encode('ascii'), 'dep')
+    grid = Grid.from_records('dep', 'B', 1, physical_state.toDict())
+
+    assert grid.transitions.tolist() == [[2, 0], [2, 1]]
+    assert np.allclose(
+        sublevel_departure_coefficients(grid, 1e4, 1e2, [(2, 0), (2, 1)]),
+        [[0.9, 0.95]],
+    )
+
+    # b_2 = (1 * b(2, 0) + 3 * b(2, 1)) / 2**2
+    b = departure_coefficients(grid, 1e4, 1e2, [2, 3])
+    assert np.isclose(b[0, 0], (0.9 + 3 * 0.95) / 4)
+    assert np.isnan(b[0, 1])
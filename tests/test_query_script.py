@@ -0,0 +1,88 @@
+"""
+Tests for streaming query results, as 'scripts/query.py' does.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils import extracting
+from src.utils.reading import Query
+from src.utils.writing import initialise_db
+
+def make_db(db_dir) -> pd.DataFrame:
+    # Tables created by 'initialise_db' have no declared column types
+    rows = pd.DataFrame({
+        'wave':     [6564.6, 4862.7, None],
+        'rec_case': ['A', 'B', 'B'],
+        'z':        [1, 1, 2],
+        'n_u':      [3, 4, 200],
+        'n_l':      [2, 2, 101],
+        'temp':     [1e4, 1e4, 4e4],
+        'dens':     [1e2, 1e2, 1.28e4],
+        'val':      [1.5e-25, 5.2e-26, 3.1e-30],
+    })
+
+    connection = initialise_db(db_dir / 'db.db')
+    rows.to_sql('emi', connection, if_exists='append', index=False)
+    connection.commit()
+    connection.close()
+
+    return rows
+
+def extract(output, *select: str, fmt: str = 'npy') -> tuple:
+    with Query.START('db') as q:
+        q = q.FROM('emi').SELECT(*(select or ('*',)))
+        return extracting.extract(q, output, fmt=fmt, chunk_size=2)
+
+@pytest.mark.parametrize('select', [(), ('rec_case', 'n_u', 'n_l', 'val')])
+def test_npy_types_from_data(db_dir, select):
+    rows = make_db(db_dir)
+
+    n_rows, dtype = extract(db_dir / 'out.npy', *select)
+    records = np.load(db_dir / 'out.npy')
+
+    assert n_rows == len(rows)
+    assert records.dtype == dtype
+    assert records.dtype['rec_case'] == np.dtype('S1')
+    assert records.dtype['n_u'] == np.dtype('i8')
+    assert records.dtype['val'] == np.dtype('f8')
+    assert records['rec_case'].tolist() == [b'A', b'B', b'B']
+    assert records['n_l'].tolist() == rows['n_l'].tolist()
+    if not select:
+        assert np.isnan(records['wave'][2])
+
+def test_npy_single_aggregate(db_dir, monkeypatch):
+    make_db(db_dir)
+
+    # The dtype and the row count come from the same pass over the result
+    calls: list = []
+    aggregate = Query.AGGREGATE
+    monkeypatch.setattr(
+        Query, 'AGGREGATE',
+        lambda q, *expression: calls.append(expression) or aggregate(q, *expression),
+    )
+
+    assert extract(db_dir / 'out.npy')[0] == 3
+    assert len(calls) == 1
+
+def test_csv(db_dir):
+    rows = make_db(db_dir)
+
+    n_rows, dtype = extract(db_dir / 'out.csv', 'n_u', 'n_l', 'val', fmt='csv')
+    written = pd.read_csv(db_dir / 'out.csv', float_precision='round_trip')
+
+    assert (n_rows, dtype) == (3, None)
+    assert written.to_dict('list') == rows[['n_u', 'n_l', 'val']].to_dict('list')
+
+def test_failed_output_is_removed(db_dir, monkeypatch):
+    make_db(db_dir)
+
+    def write_bin(q, stream, *args, **kwargs):
+        stream.write(b'partial')
+        raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(extracting, 'write_bin', write_bin)
+    with pytest.raises(RuntimeError):
+        extract(db_dir / 'out.npy')
+
+    assert not (db_dir / 'out.npy').exists()
@@ -0,0 +1,18 @@
+"""
+Tests for querying databases.
+"""
+import sqlite3
+
+import pytest
+
+from src.utils.reading import Query
+
+def test_federated_missing_database(db_dir):
+    with sqlite3.connect(db_dir / 'present.db') as connection:
+        connection.execute("CREATE TABLE emi (z, val)")
+
+    for names in (['missing', 'present'], ['present', 'missing']):
+        with pytest.raises(FileNotFoundError, match='missing'):
+            Query.START(names)
+
+    assert not (db_dir / 'missing.db').exists()
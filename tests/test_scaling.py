@@ -0,0 +1,110 @@
+"""
+Tests for serving compacted ions by hydrogenic scaling.
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.grid import Grid
+from src.utils.reading import Query
+from src.utils.scaling import compact_database
+from src.utils.extrapolation import get_extrapolation, _get_extrapolation
+
+from samples import COLUMNS, write_emi_db
+
+def query_z(name, z: int) -> pd.DataFrame:
+    with Query.START(name) as q:
+        records = q.FROM('emi').SELECT('*') \
+            .WHERE('z', f"z == {z}") \
+            .ORDER_BY(['n_u', 'n_l', 'temp', 'dens']) \
+            .STOP()
+
+    return pd.DataFrame(records)
+
+@pytest.fixture
+def compacted(db_dir):
+    write_emi_db(db_dir / 'db.db')
+    expected = query_z('db', 2)
+
+    (report,) = compact_database(name='db', tables=['emi'])
+    assert report.accepted
+
+    with sqlite3.connect(db_dir / 'db.db') as connection:
+        assert connection.execute(
+            "SELECT COUNT(*) FROM emi WHERE z == 2"
+        ).fetchone() == (0,)
+
+    return expected
+
+def test_query_compacted(compacted):
+    served = query_z('db', 2)
+
+    assert list(served.columns) == COLUMNS
+    assert len(served) == len(compacted) > 0
+    assert (served['z'] == 2).all()
+    for column in ('wave', 'temp', 'dens', 'val'):
+        assert np.allclose(served[column], compacted[column], rtol=1e-12)
+
+    # The reference ion is served as stored
+    assert (query_z('db', 1)['z'] == 1).all()
+
+    with Query.START('db') as q:
+        chunks = list(q.FROM('emi').SELECT('val').WHERE('z', 'z == 2').STREAM(7))
+    assert sum(len(chunk['val']) for chunk in chunks) == len(compacted)
+
+def test_federated_compacted(db_dir, compacted):
+    write_emi_db(db_dir / 'other.db', zs=(3,))
+
+    with Query.START(['db', 'other']) as q:
+        (n_rows,) = q.FROM('emi').SELECT('val') \
+            .WHERE('z', 'z == 2') \
+            .AGGREGATE('COUNT(*)')
+    assert n_rows == len(compacted)
+
+def test_grid_and_extrapolation_compacted(compacted):
+    grid = Grid.from_query('emi', 2, 'B', name='db')
+    assert np.allclose(grid.temps, np.unique(compacted['temp']))
+
+    _get_extrapolation.cache_clear()
+    extrap = get_extrapolation('emi', 2, 'B', name='db', n_fit=4)
+    assert extrap.z == 2 and (extrap.n_c == 10).all()
+    _get_extrapolation.cache_clear()
+
+def test_compacted_aggregates(db_dir):
+    from src.utils.writing import create_aggregates
+
+    write_emi_db(db_dir / 'db.db')
+    with sqlite3.connect(db_dir / 'db.db') as connection:
+        emi = pd.read_sql_query("SELECT * FROM emi", connection)
+        for table, df in create_aggregates(emi, 'emi').items():
+            df.to_sql(table, connection, index=False)
+
+    tables = ['emi_series', 'emi_lower_totals', 'emi_totals', 'emi_ratios']
+
+    def query(table):
+        with Query.START('db') as q:
+            return pd.DataFrame(q.FROM(table).SELECT('*').WHERE('z', 'z == 2').STOP()) \
+                .sort_values(['temp', 'dens', *q.column_names]).reset_index(drop=True)
+
+    expected = dict((table, query(table)) for table in tables)
+    (report,) = compact_database(name='db', tables=['emi'])
+    assert report.accepted
+
+    with sqlite3.connect(db_dir / 'db.db') as connection:
+        for table in tables:
+            assert connection.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE z == 2"
+            ).fetchone() == (0,)
+
+    # Served scaled from the reference ion, ratios unscaled
+    for table in tables:
+        served = query(table)
+        assert list(served.columns) == list(expected[table].columns)
+        assert len(served) == len(expected[table]) > 0
+        for column in served.columns:
+            if served[column].dtype.kind == 'f':
+                assert np.allclose(served[column], expected[table][column], rtol=1e-9)
+            else:
+                assert (served[column] == expected[table][column]).all()
@@ -0,0 +1,171 @@
+"""
+Tests for serving a database over a Unix domain socket.
+"""
+from threading import Thread, Barrier
+
+import numpy as np
+import pytest
+
+from src.utils import serving
+from src.utils.grid import Grid
+from src.utils.reading import Query
+from src.utils.scaling import compact_database
+from src.utils.serving import GridServer, RemoteClient, RemoteQuery
+
+from samples import write_emi_db
+
+@pytest.fixture
+def server(db_dir, monkeypatch):
+    monkeypatch.setattr(serving, 'db_dir', db_dir)
+    write_emi_db(db_dir / 'db.db')
+
+    def start(compact: bool = False) -> GridServer:
+        if compact:
+            compact_database(name='db', tables=['emi'])
+
+        servers.append(server := GridServer(name='db'))
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    servers: list[GridServer] = []
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def local_query(*select: str, where: str = 'z == 1') -> dict:
+    with Query.START('db') as q:
+        return q.FROM('emi').SELECT(*select).WHERE('z', where) \
+            .ORDER_BY(['n_u', 'n_l', 'temp', 'dens']).STOP()
+
+def test_missing_database(db_dir):
+    with pytest.raises(FileNotFoundError):
+        GridServer(name='missing')
+    assert not (db_dir / 'missing.db').exists()
+
+def test_remote_query_single_database(server):
+    with pytest.raises(TypeError):
+        RemoteQuery.START(['db', 'other'])
+
+def test_sql_and_column_info(server):
+    server()
+
+    with RemoteQuery.START('db') as q:
+        q = q.FROM('emi').SELECT('*').WHERE('z', 'z == 1') \
+            .ORDER_BY(['n_u', 'n_l', 'temp', 'dens'])
+        records = q.STOP()
+        column_info = q.column_info
+        (n_rows,) = q.AGGREGATE('COUNT(*)')
+
+    with Query.START('db') as local:
+        assert column_info == local.FROM('emi').column_info
+
+    assert records == local_query('*')
+    assert n_rows == len(records['val'])
+
+@pytest.mark.parametrize('chunk_size', [7, 270, 1000])
+def test_stream(server, chunk_size):
+    server()
+    expected = local_query('n_u', 'n_l', 'val')
+
+    with RemoteQuery.START('db') as q:
+        q = q.FROM('emi').SELECT('n_u', 'n_l', 'val').WHERE('z', 'z == 1') \
+            .ORDER_BY(['n_u', 'n_l', 'temp', 'dens'])
+        chunks = list(q.STREAM(chunk_size))
+
+        # Stopping early closes the server's cursor, and the client stays usable
+        for _ in q.STREAM(5):
+            break
+        (n_rows,) = q.AGGREGATE('COUNT(*)')
+
+    assert all(0 < len(chunk['val']) <= chunk_size for chunk in chunks)
+    for column, values in expected.items():
+        assert sum((chunk[column] for chunk in chunks), []) == values
+    assert n_rows == len(expected['val'])
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_interpolate(server, compact):
+    server(compact=compact)
+    temp, dens = [5e3, 2e4, 1e5], [2e4, 1e5, 1e6]
+    expected = Grid.from_query('emi', 2, 'B', name='db').interpolate(temp, dens)
+
+    with RemoteClient('db') as client:
+        transitions, values = client.interpolate('emi', 2, 'B', temp, dens)
+
+    assert transitions.shape == (values.shape[1], 2)
+    assert np.isfinite(values).all()
+    assert np.allclose(values, expected)
+
+def test_rejects_non_select(server):
+    server()
+
+    with RemoteClient('db') as client:
+        for op in ('sql', 'open'):
+            with pytest.raises(RuntimeError, match='Only SELECT'):
+                client.request([{'op': op, 'query': "DELETE FROM emi"}])
+
+        (result,) = client.request([{'op': 'sql', 'query': "SELECT COUNT(*) AS n FROM emi"}])
+    assert result['n'] == [540]
+
+def run_concurrently(n_clients: int, get_ops) -> list:
+    """
+    Sends the requests 'get_ops(idx)' from separate clients at once.
+    """
+    barrier = Barrier(n_clients)
+    results: list = [None] * n_clients
+
+    def run(idx: int) -> None:
+        with RemoteClient('db') as client:
+            barrier.wait()
+            results[idx] = client.request(get_ops(idx))
+
+    threads = [Thread(target=run, args=(idx,)) for idx in range(n_clients)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    return results
+
+def test_coalesces_identical_requests(server, monkeypatch):
+    from time import sleep
+
+    grid_server = server()
+    query: str = "SELECT val FROM emi WHERE z == 1"
+
+    calls: list[str] = []
+    execute = grid_server.execute
+
+    def slow_execute(q: str) -> dict:
+        calls.append(q)
+        sleep(0.2)
+        return execute(q)
+
+    monkeypatch.setattr(grid_server, 'execute', slow_execute)
+
+    results = run_concurrently(4, lambda idx: [{'op': 'sql', 'query': query}])
+    assert calls.count(query) == 1
+    assert all(result == results[0] for result in results)
+
+def test_builds_each_grid_once(server, monkeypatch):
+    from time import sleep
+
+    grid_server = server(compact=True)
+
+    builds: list[tuple] = []
+    build = grid_server._buildGrid
+
+    def slow_build(key: tuple):
+        builds.append(key)
+        sleep(0.2)
+        return build(key)
+
+    monkeypatch.setattr(grid_server, '_buildGrid', slow_build)
+
+    # Different points, so the interpolations themselves are not shared
+    results = run_concurrently(4, lambda idx: [{
+        'op': 'interpolate', 'table': 'emi', 'z': 2, 'rec_case': 'B',
+        'temp': [5e3 + 1e4 * idx], 'dens': [1e5],
+    }])
+
+    assert builds == [('emi', 2, 'B')]
+    assert all(np.isfinite(result[0]['values']).all() for result in results)
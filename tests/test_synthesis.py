@@ -0,0 +1,81 @@
+"""
+Tests for synthesising spectra from line fluxes.
+"""
+import numpy as np
+import pytest
+
+from src.utils.synthesis import (
+    C_KMS, N_SIGMA, log_wave_grid, bin_lines, broaden, synthesize,
+)
+
+def gaussian_profile(grid, wave, sigma):
+    # Exact Gaussian in velocity, as flux per unit wavelength
+    v = C_KMS * np.log(grid / wave)
+    return np.exp(-v**2 / (2 * sigma**2)) / (np.sqrt(2 * np.pi) * sigma) \
+        * C_KMS / grid
+
+def test_log_wave_grid():
+    grid = log_wave_grid(6500., 6630., 7.5)
+
+    assert grid[0] == 6500.
+    assert grid[-1] <= 6630. < grid[-1] * np.exp(7.5 / C_KMS)
+    assert np.allclose(np.diff(np.log(grid)), 7.5 / C_KMS, rtol=1e-9, atol=0)
+
+def test_bin_lines_conserves_flux():
+    grid = log_wave_grid(6500., 6630., 7.5)
+    waves = np.array([6400., 6500., 6563.21, 6583.45, 6629.9, 6700.])
+    fluxes = np.array([[1., 2., 3., 4., 5., 6.], [6., 5., 4., 3., 2., 1.]])
+
+    binned = bin_lines(waves, fluxes, grid)
+
+    # Lines off the grid are dropped, the rest are split between two pixels
+    assert binned.shape == (2, grid.size)
+    assert np.allclose(binned.sum(axis=-1), fluxes[:, 1:5].sum(axis=-1))
+    assert np.count_nonzero(binned[0]) == 7
+
+    # The split keeps the line's centroid in ln(wave)
+    pos = np.log(6563.21 / grid[0]) / np.log(grid[1] / grid[0])
+    single = bin_lines([6563.21], [1.], grid)
+    assert np.isclose(single @ np.arange(grid.size), pos)
+
+def test_broaden_matches_direct_convolution():
+    step, sigma = 7.5, 30.
+    grid = log_wave_grid(6500., 6630., step)
+    binned = bin_lines([6563.21, 6583.45], [[1., 0.3], [0.5, 2.]], grid)
+
+    sigma_pix = sigma / step
+    k = np.arange(-int(N_SIGMA * sigma_pix), int(N_SIGMA * sigma_pix) + 1)
+    kernel = np.exp(-k**2 / (2 * sigma_pix**2))
+    kernel /= kernel.sum()
+
+    direct = np.array([np.convolve(b, kernel, mode='same') for b in binned])
+    broadened = broaden(binned, step, sigma)
+
+    assert broadened.shape == (1, *binned.shape)
+    assert np.allclose(broadened[0], direct, rtol=0, atol=1e-12)
+
+@pytest.mark.parametrize('wave', [6563., 6563.21, 6563.45])
+def test_synthesize_matches_gaussian_profile(wave):
+    sigmas = np.array([30., 60.])
+    grid, spectra = synthesize([wave], [1.], 6500., 6630., sigmas)
+
+    for sigma, spectrum in zip(sigmas, spectra):
+        exact = gaussian_profile(grid, wave, sigma)
+
+        # Flux is conserved
+        assert np.isclose(np.trapezoid(spectrum, grid), 1., rtol=1e-6)
+
+        # Binning error is below 1/(8 n**2) of the peak, at n = 4 pixels per
+        # standard deviation of the narrowest kernel (measured: ~0.76%)
+        n = 4 * sigma / sigmas.min()
+        error = np.abs(spectrum - exact).max() / exact.max()
+        assert error < 1 / (8 * n**2)
+
+def test_synthesize_instrumental_broadening():
+    grid, spectra = synthesize(
+        [6563.21], [1.], 6500., 6630., 30., sigma_instrumental=40.,
+        velocity_step=2.,
+    )
+    exact = gaussian_profile(grid, 6563.21, 50.)
+
+    assert np.abs(spectra[0] - exact).max() / exact.max() < 1 / (8 * 25**2)
@@ -0,0 +1,86 @@
+"""
+Tests for sorting, merging, and writing parsed data.
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from src.utils.writing import (
+    merge_sorted_runs, iter_sorted_chunks, create_dataframes,
+    write_chunks_to_db, parse_datafile,
+)
+
+from samples import make_datafile, write_gzip
+
+def make_data_dir(path):
+    """
+    Files of z = 1 split over two temperature ranges (so that every (n_l, n_u)
+    appears in both), and a single file of z = 2.
+    """
+    path.mkdir()
+    write_gzip(path / 'r1b0100.d.gz', make_datafile(1, 'B', (1e2, 5e2), (1e2, 1e4)))
+    write_gzip(path / 'r1b0300.d.gz', make_datafile(1, 'B', (1e3, 3e3), (1e2, 1e4)))
+    write_gzip(path / 'r2b0100.d.gz', make_datafile(2, 'B', (4e2,), (1e2,)))
+    return path
+
+def test_merge_sorted_runs_is_stable():
+    rng = np.random.default_rng(0)
+
+    runs = []
+    for run in range(4):
+        n: int = int(rng.integers(1, 50))
+        df = pd.DataFrame({
+            # Few distinct keys, so that ties within and across runs abound
+            'n_l': rng.integers(1, 4, n),
+            'n_u': rng.integers(2, 6, n),
+            'run': run,
+            'pos': np.arange(n),
+        })
+        runs.append(df.sort_values(['n_l', 'n_u'], kind='stable', ignore_index=True))
+
+    expected = pd.concat(runs, ignore_index=True) \
+        .sort_values(['n_l', 'n_u'], kind='stable', ignore_index=True)
+
+    assert merge_sorted_runs(runs).equals(expected)
+    assert merge_sorted_runs(runs[:1]).equals(runs[0])
+
+def test_iter_sorted_chunks(tmp_path):
+    path = make_data_dir(tmp_path / 'data')
+
+    chunks = list(iter_sorted_chunks(path, data_types=['emi']))
+    assert [tuple(c['emi'][['rec_case', 'z']].drop_duplicates().iloc[0]) \
+        for c in chunks] == [('B', 1), ('B', 2)]
+
+    # Equal to one global sort of the files' rows, in file order
+    runs = [
+        pd.DataFrame(parse_datafile(path / fname, data_types=['emi'])['emi'].toDict())
+        for fname in ('r1b0100.d.gz', 'r1b0300.d.gz')
+    ]
+    expected = pd.concat(runs, ignore_index=True) \
+        .sort_values(['n_l', 'n_u'], kind='stable', ignore_index=True)
+
+    assert chunks[0]['emi'].equals(expected)
+
+def test_write_chunks_to_db(tmp_path):
+    path = make_data_dir(tmp_path / 'data')
+
+    with sqlite3.connect(tmp_path / 'chunked.db') as connection:
+        write_chunks_to_db(
+            iter_sorted_chunks(path, aggregates=True), connection,
+        )
+        chunked = dict(
+            (table, pd.read_sql_query(f"SELECT * FROM {table}", connection)) \
+            for (table,) in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type='table'"
+            )
+        )
+
+    expected = create_dataframes(path, aggregates=True)
+    assert set(chunked) == set(t for t, df in expected.items() if len(df) > 0)
+
+    with sqlite3.connect(tmp_path / 'single.db') as connection:
+        for table in chunked:
+            expected[table].to_sql(table, connection, index=False)
+            single = pd.read_sql_query(f"SELECT * FROM {table}", connection)
+            pd.testing.assert_frame_equal(chunked[table], single)